@@ -3,20 +3,26 @@ import json
 import time
 import random
 import os
+import traceback
 
+import aiohttp
 import brawlstats
 import datadog
 import discord
-from cachetools import TTLCache
 from datetime import datetime
 from discord.ext import commands
 
 import box
 from ext import utils
+from ext.api import APIClient, Body
+from ext.breaker import CircuitBreaker
+from ext.clanstats import ClanStats
 from ext.command import cog, command
 from ext.context import NoContext
 from ext.embeds import brawlstars
+from ext.ratelimit import TokenBucket
 from ext.paginator import Paginator, WikiPaginator
+from ext.retry import Retry
 from locales.i18n import Translator
 
 _ = Translator('Brawl Stars', __file__)
@@ -71,7 +77,14 @@ class Brawl_Stars:
         self.bot = bot
         self.alias = 'bs'
         self.conv = TagCheck()
-        self.cache = TTLCache(500, 180)
+        self.api = APIClient('brawlstars', budget=8 * 1024 ** 2, budgets={
+            'get_leaderboard': 2 * 1024 ** 2,
+            'bossboard': 1024 ** 2,
+            'rumbleboard': 1024 ** 2
+        }, serve_stale={'get_player', 'get_club'}, store=bot.disk_cache, persist={
+            'get_player': lambda data: brawlstats.Profile(self.bs, None, data),
+            'get_club': lambda data: brawlstats.Club(self.bs, None, data)
+        }, missing=(brawlstats.NotFoundError,), limiter=TokenBucket(10, 20))
         self.bs = brawlstats.core.Client(
             os.getenv('brawlstars'),
             session=bot.session,
@@ -79,6 +92,18 @@ class Brawl_Stars:
             timeout=30,
             url=os.getenv('bs_url')
         )
+        self.breaker = CircuitBreaker(
+            'brawlstars',
+            failures=(brawlstats.ServerError, brawlstats.UnexpectedError, aiohttp.ClientError, asyncio.TimeoutError),
+            trip_on=(brawlstats.MaintenanceError,)
+        )
+        self.retry = Retry(*self.breaker.failures, base=2, deadline=180)
+        # clubs fetched at once by the club stats, the rate limiter paces the requests
+        self.clanstats_semaphore = asyncio.Semaphore(10)
+        self.clanstats = ClanStats(
+            bot, 'brawlstars', 'bsclubinfo', 'clubs',
+            fetch=self.get_clubs, render=self.format_clubstats
+        )
         self.constants = None
         self.bot.loop.create_task(self.load_constants())
         if not self.bot.dev_mode:
@@ -91,11 +116,11 @@ class Brawl_Stars:
                 await resp.json(),
                 camel_killer_box=True
             )
+        brawlstars.index_brawlers(self.constants)
 
     async def __local_check(self, ctx):
         if isinstance(ctx.channel, discord.TextChannel):
-            guild_info = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
-            return guild_info.get('games', {}).get(self.__class__.__name__, True)
+            return await self.bot.guild_config.game_enabled(ctx.guild.id, self.__class__.__name__)
         else:
             return True
 
@@ -162,9 +187,13 @@ class Brawl_Stars:
     async def request(self, method, *args, **kwargs):
         leaderboard = kwargs.pop('leaderboard', False)
         reason = kwargs.pop('reason', 'command')
-        try:
-            data = self.cache[f'{method}{args}{kwargs}']
-        except KeyError:
+        stale = kwargs.pop('stale', None)
+
+        async def request():
+            async with self.breaker:
+                return await fetch()
+
+        async def fetch():
             if leaderboard:
                 speed = time.time()
                 async with self.bot.session.get(
@@ -174,28 +203,28 @@ class Brawl_Stars:
                     datadog.statsd.increment('statsy.requests', 1, [
                         'game:brawlstars', f'code:{resp.status}', f'method:{method}', f'reason:{reason}'
                     ])
-                    data = box.Box(json.loads((await resp.text()).replace('jsonCallBack(', '')[:-2]), camel_killer_box=True)
-            else:
-                speed = time.time()
-                data = await getattr(self.bs, method)(*args, **kwargs)
+                    text = await resp.text()
+                    return Body(box.Box(json.loads(text.replace('jsonCallBack(', '')[:-2]), camel_killer_box=True), len(text))
 
-                speed = time.time() - speed
+            speed = time.time()
+            data = await getattr(self.bs, method)(*args, **kwargs)
 
-                if isinstance(data, list):
-                    status_code = 'list'
-                else:
-                    status_code = data.resp.status
+            speed = time.time() - speed
 
-                datadog.statsd.increment('statsy.api_latency', 1, [
-                    'game:brawlstars', f'speed:{speed}', f'method:{method}'
-                ])
-                datadog.statsd.increment('statsy.requests', 1, [
-                    'game:brawlstars', f'code:{status_code}', f'method:{method}', f'reason:{reason}'
-                ])
+            if isinstance(data, list):
+                status_code = 'list'
+            else:
+                status_code = data.resp.status
 
-            self.cache[f'{method}{args}{kwargs}'] = data
+            datadog.statsd.increment('statsy.api_latency', 1, [
+                'game:brawlstars', f'speed:{speed}', f'method:{method}'
+            ])
+            datadog.statsd.increment('statsy.requests', 1, [
+                'game:brawlstars', f'code:{status_code}', f'method:{method}', f'reason:{reason}'
+            ])
+            return data
 
-        return data
+        return await self.api.fetch(request, method, *args, stale=stale, reason=reason, **kwargs)
 
     @command()
     async def save(self, ctx, tag, index: str = '0'):
@@ -206,6 +235,7 @@ class Brawl_Stars:
             raise utils.InvalidBSTag
 
         await ctx.save_tag(tag, 'brawlstars', index=index.replace('-', ''))
+        self.api.forget(tag)
         try:
             default_game = self.bot.default_game[ctx.guild.id]
         except AttributeError:
@@ -352,7 +382,7 @@ class Brawl_Stars:
             return
 
         if isinstance(ctx.channel, discord.TextChannel):
-            ctx.language = (await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}).get('language', 'messages')
+            ctx.language = await self.bot.guild_config.language(ctx.guild.id)
         else:
             ctx.language = 'messages'
 
@@ -372,7 +402,7 @@ class Brawl_Stars:
                 await self.request('get_club', player.club.tag, reason='magic caching')
             except (AttributeError, IndexError):
                 pass
-        except (utils.NoTag, commands.CheckFailure, brawlstats.RequestError):
+        except (utils.NoTag, utils.RateLimited, commands.CheckFailure, brawlstats.RequestError):
             pass
 
     async def event_notifications(self):
@@ -419,73 +449,41 @@ class Brawl_Stars:
                         pass
 
     async def get_club_inf(self, tag):
-        try:
-            return await self.request('get_club', tag, reason='clanstats')
-        except brawlstats.MaintenanceError:
-            await asyncio.sleep(60 * 5)
-            return await self.get_club_inf(tag)
-        except brawlstats.RequestError:
-            await asyncio.sleep(1)
-            return await self.get_club_inf(tag)
+        return await self.retry(self.request, 'get_club', tag, reason='clanstats', stale=False)
 
     async def get_clubs(self, *tags):
-        clans = []
-        for t in tags:
-            clans.append(await self.get_club_inf(t))
-            await asyncio.sleep(0.5)
-        return clans
-
-    async def clanupdate(self, clan=None):
-        if not clan:
-            guilds = await self.bot.mongo.config.guilds.find({'bsclubinfo': {'$exists': True}}).to_list(None)
-        else:
-            guilds = [clan]
-
-        for g in guilds:
-            m = g['bsclubinfo']
-            clans = await self.get_clubs(*m['clubs'])
-
-            embed = discord.Embed(title="Club Statistics!", color=0xf1c40f, timestamp=datetime.utcnow())
-            total_members = 0
+        """Returns the club of each tag, None for the clubs that could not be fetched"""
+        async def get_club(tag):
+            async with self.clanstats_semaphore:
+                try:
+                    return await self.get_club_inf(tag)
+                except self.retry.errors + (brawlstats.RequestError, ValueError):
+                    # ValueError: a tag the client rejects
+                    return None
 
-            for i in range(len(clans)):
-                embed.add_field(name=clans[i].name, value=brawlstars.format_club_stats(clans[i]))
-                total_members += len(clans[i].members)
+        return await asyncio.gather(*[get_club(t) for t in tags])
 
-            embed.add_field(name='More Info', value=f"{utils.e('friends')} {total_members}/{100*len(clans)}", inline=False)
+    def format_clubstats(self, clubs):
+        embed = discord.Embed(title="Club Statistics!", color=0xf1c40f, timestamp=datetime.utcnow())
+        total_members = 0
 
-            try:
-                channel = self.bot.get_channel(int(m['channel']))
-                message = await channel.get_message(int(m['message']))
-            except AttributeError:
-                message = None
+        for club in clubs:
+            embed.add_field(name=club.name, value=brawlstars.format_club_stats(club))
+            total_members += len(club.members)
 
-            if not message:
-                try:
-                    message = await self.bot.get_channel(int(m['channel'])).send('Clan Stats')
-                except AttributeError:
-                    await self.bot.mongo.find_one_and_delete({'guild_id': str(g['guild_id'])})
-                    break
-
-            await message.edit(content='', embed=embed)
-            return message
+        embed.add_field(name='More Info', value=f"{utils.e('friends')} {total_members}/{100*len(clubs)}", inline=False)
+        return embed
 
     async def on_raw_reaction_add(self, payload):
-        data = await self.bot.mongo.config.guilds.find_one({'guild_id': str(payload.guild_id), 'bsclubinfo.message': str(payload.message_id)})
-        if data:
-            member = self.bot.get_guild(payload.guild_id).get_member(payload.user_id)
-
-            if member == self.bot.user:
-                return
-
-            message = await self.clanupdate(data)
-            await message.clear_reactions()
-            await message.add_reaction(':refresh:477405504512065536')
+        await self.clanstats.on_reaction(payload)
 
     async def clan_update_loop(self):
         await self.bot.wait_until_ready()
         while not self.bot.is_closed():
-            await self.clanupdate()
+            try:
+                await self.clanstats.refresh()
+            except Exception:
+                traceback.print_exc()
             await asyncio.sleep(600)
 
 
@@ -1,3 +1,4 @@
+import asyncio
 import io
 import time
 import os
@@ -5,13 +6,15 @@ import os
 import aiohttp
 import datadog
 import discord
-from cachetools import TTLCache
 from discord.ext import commands
 from PIL import Image
 
 from ext import utils
+from ext.api import APIClient, read_json
+from ext.breaker import CircuitBreaker
 from ext.command import cog, command, group
 from ext.embeds import clashofclans
+from ext.ratelimit import TokenBucket
 from ext.paginator import Paginator
 from locales.i18n import Translator
 
@@ -67,22 +70,34 @@ class Clash_Of_Clans:
         self.bot = bot
         self.alias = 'coc'
         self.conv = TagCheck()
-        self.cache = TTLCache(500, 180)
+        self.api = APIClient(
+            'clashofclans',
+            budgets={'clans': 16 * 1024 ** 2},
+            classify=lambda endpoint: endpoint.split('/')[0],
+            serve_stale={'players', 'clans'},
+            store=bot.disk_cache,
+            persist={'players': dict, 'clans': dict},
+            # unknown tags and private war logs
+            is_missing=lambda data: data.get('reason') in ('notFound', 'accessDenied'),
+            limiter=TokenBucket(20, 40)
+        )
+        self.breaker = CircuitBreaker('clashofclans', failures=(utils.APIError, aiohttp.ClientError, asyncio.TimeoutError))
 
     def __unload(self):
         self.bot.loop.create_task(self.session.close())
 
     async def __local_check(self, ctx):
         if isinstance(ctx.channel, discord.TextChannel):
-            guild_info = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
-            return guild_info.get('games', {}).get(self.__class__.__name__, True)
+            return await self.bot.guild_config.game_enabled(ctx.guild.id, self.__class__.__name__)
         else:
             return True
 
-    async def request(self, ctx, endpoint, *, reason='command'):
-        try:
-            self.cache[endpoint]
-        except KeyError:
+    async def request(self, ctx, endpoint, *, reason='command', stale=None):
+        async def request():
+            async with self.breaker:
+                return await fetch()
+
+        async def fetch():
             speed = time.time()
             async with self.bot.session.get(
                 f"http://{os.getenv('spike')}/redirect?url=https://api.clashofclans.com/v1/{endpoint}",
@@ -96,25 +111,30 @@ class Clash_Of_Clans:
                     'game:clashofclans', f'code:{resp.status}', f'method:{endpoint}', f'reason:{reason}'
                 ])
                 try:
-                    self.cache[endpoint] = await resp.json()
-                except aiohttp.ContentTypeError:
-                    er = discord.Embed(
-                        title=_('Clash of Clans Server Down'),
-                        color=discord.Color.red(),
-                        description='This could be caused by a maintainence break.'
-                    )
-                    if ctx.bot.psa_message:
-                        er.add_field(name=_('Please Note!'), value=ctx.bot.psa_message)
-                    await ctx.send(embed=er)
-
-                    # end and ignore error
-                    raise commands.CheckFailure
-
-        if self.cache[endpoint] == {"reason": "notFound"}:
+                    return await read_json(resp)
+                except aiohttp.ContentTypeError as e:
+                    raise utils.APIError from e
+
+        try:
+            data = await self.api.fetch(request, endpoint, stale=stale, reason=reason)
+        except (utils.APIError, aiohttp.ClientError, asyncio.TimeoutError):
+            er = discord.Embed(
+                title=_('Clash of Clans Server Down'),
+                color=discord.Color.red(),
+                description='This could be caused by a maintainence break.'
+            )
+            if ctx.bot.psa_message:
+                er.add_field(name=_('Please Note!'), value=ctx.bot.psa_message)
+            await ctx.send(embed=er)
+
+            # end and ignore error
+            raise commands.CheckFailure
+
+        if data == {"reason": "notFound"}:
             await ctx.send(_('The tag cannot be found!'))
             raise utils.NoTag
 
-        return self.cache[endpoint]
+        return data
 
     async def get_clan_from_profile(self, ctx, tag, message):
         profile = await self.request(ctx, f'players/%23{tag}')
@@ -246,6 +266,7 @@ class Clash_Of_Clans:
             raise utils.InvalidTag('Invalid cr-tag passed')
 
         await ctx.save_tag(tag, 'clashofclans', index=index.replace('-', ''))
+        self.api.forget(tag)
 
         try:
             default_game = self.bot.default_game[ctx.guild.id]
@@ -278,7 +299,7 @@ class Clash_Of_Clans:
         """Check your current war status."""
         tag = await self.resolve_tag(ctx, tag_or_user, clan=True)
         async with ctx.typing():
-            war = await self.request(ctx, f'clans/%23{tag}/currentwar')
+            war = await self.request(ctx, f'clans/%23{tag}/currentwar', stale=False)
             if "reason" in war:
                 return await ctx.send(_("This clan's war logs aren't public."))
             if war['state'] == 'notInWar':
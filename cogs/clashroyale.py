@@ -5,7 +5,6 @@ import random
 import os
 import time
 from base64 import b64decode
-from collections import OrderedDict
 from datetime import datetime
 import traceback
 
@@ -13,17 +12,21 @@ import clashroyale
 import datadog
 import discord
 import requests
-from cachetools import TTLCache
 from discord.ext import commands
 from oauth2client.service_account import ServiceAccountCredentials
-from pymongo import ReturnDocument
 
 from ext import utils
+from ext.api import APIClient, read_json
+from ext.breaker import CircuitBreaker
+from ext.clanstats import ClanStats
 from ext.context import NoContext
 from ext.command import cog, command, group
 from ext.utils import e
 from ext.embeds import clashroyale as cr
+from ext.leaderboard import Leaderboard
+from ext.ratelimit import TokenBucket
 from ext.paginator import Paginator
+from ext.retry import Retry
 from locales.i18n import Translator
 
 _ = Translator('Clash Royale', __file__)
@@ -130,7 +133,15 @@ class Clash_Royale:
     def __init__(self, bot):
         self.bot = bot
         self.conv = TagCheck()
-        self.cache = TTLCache(500, 180)
+        self.api = APIClient('clashroyale', budgets={
+            'get_top_players': 2 * 1024 ** 2,
+            'get_top_clans': 2 * 1024 ** 2,
+            'get_top_clanwar_clans': 2 * 1024 ** 2
+        }, serve_stale={'get_player', 'get_clan'}, store=bot.disk_cache, persist={
+            'get_player': self.load_model,
+            'get_clan': self.load_model,
+            'get_clan_war': self.load_model
+        }, missing=(clashroyale.NotFoundError,), limiter=TokenBucket(20, 40))
         scopes = [
             "https://www.googleapis.com/auth/userinfo.email",
             "https://www.googleapis.com/auth/firebase.database"
@@ -155,14 +166,30 @@ class Clash_Royale:
             is_async=True,
             timeout=20
         )
+        down = (clashroyale.ServerError, clashroyale.NotResponding, clashroyale.NetworkError, clashroyale.UnexpectedError)
+        self.cr_breaker = CircuitBreaker('clashroyale', failures=down)
+        self.royaleapi_breaker = CircuitBreaker('royaleapi', failures=down)
+        self.retry = Retry(*down, base=2, deadline=180)
+        # clans fetched at once by the clan stats, the rate limiter paces the requests
+        self.clanstats_semaphore = asyncio.Semaphore(10)
+        self.clanstats = ClanStats(
+            bot, 'clashroyale', 'claninfo', 'clans',
+            fetch=self.get_clans, render=self.format_clanstats
+        )
+        # the dump is only read by the leaderboards, which keep their own index of it
+        self.leaderboards = Leaderboard(bot.mongo.leaderboard.clashroyale, load=lambda: self.request_db(cache=False))
+        self.leaderboards_task = self.bot.loop.create_task(self.leaderboards.run())
 
         if not self.bot.dev_mode:
             self.bot.clan_update = self.bot.loop.create_task(self.clan_update_loop())
 
+    def __unload(self):
+        self.leaderboards_task.cancel()
+        self.bot.loop.create_task(self.leaderboards.flush())
+
     async def __local_check(self, ctx):
         if isinstance(ctx.channel, discord.TextChannel):
-            guild_info = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
-            return guild_info.get('games', {}).get(self.__class__.__name__, True)
+            return await self.bot.guild_config.game_enabled(ctx.guild.id, self.__class__.__name__)
         else:
             return True
 
@@ -183,13 +210,16 @@ class Clash_Royale:
     async def request(self, ctx, method, *args, **kwargs):
         client = kwargs.pop('client', self.cr)
         reason = kwargs.pop('reason', 'command')
-        try:
-            data = self.cache[f'{method}{args}{kwargs}']
-        except KeyError:
+        stale = kwargs.pop('stale', None)
+
+        async def request():
             speed = time.time()
-            data = await getattr(client, method)(*args, **kwargs)
+            async with self.cr_breaker if client is self.cr else self.royaleapi_breaker:
+                data = await getattr(client, method)(*args, **kwargs)
             speed = time.time() - speed
-            self.cache[f'{method}{args}{kwargs}'] = data
+
+            if method == 'get_player' and client is self.cr:
+                self.leaderboards.record(data.raw_data)
 
             if isinstance(data, list):
                 status_code = 'list'
@@ -202,12 +232,16 @@ class Clash_Royale:
             datadog.statsd.increment('statsy.api_latency', 1, [
                 'game:clashroyale', f'speed:{speed}', f'method:{method}'
             ])
-        return data
+            return data
+
+        endpoint = method if client is self.cr else f'royaleapi.{method}'
+        return await self.api.fetch(request, endpoint, *args, stale=stale, reason=reason, **kwargs)
+
+    def load_model(self, data):
+        return self.cr._convert_model(data, True, None, None, None)
 
     async def request_db(self, **kwargs):
-        try:
-            return self.cache[f'LBDB{kwargs}']
-        except KeyError:
+        async def request():
             async with self.bot.session.request(
                 kwargs.get('method', 'GET'),
                 kwargs.get('url', 'https://statsy-fourjr.firebaseio.com/players.json'),
@@ -215,8 +249,9 @@ class Clash_Royale:
                 json=kwargs.get('json', {}),
                 params=kwargs.get('params', {})
             ) as resp:
-                self.cache[f'LBDB{kwargs}'] = await resp.json()
-                return self.cache[f'LBDB{kwargs}']
+                return await read_json(resp)
+
+        return await self.api.fetch(request, 'LBDB', **kwargs)
 
     async def get_clan_from_profile(self, ctx, tag, message):
         p = await self.request(ctx, 'get_player', tag)
@@ -303,17 +338,15 @@ class Clash_Royale:
             ctx = await self.bot.get_context(m)
             ctx.force_cog = self
             if isinstance(ctx.channel, discord.TextChannel):
-                ctx.language = (await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}).get('language', 'messages')
+                ctx.language = await self.bot.guild_config.language(ctx.guild.id)
             else:
                 ctx.language = 'messages'
             try:
-                tournament = await self.request(ctx, 'get_tournament', m.content.split(' ')[0], reason='tournament_log')
+                tournament = await self.retry(
+                    self.request, ctx, 'get_tournament', m.content.split(' ')[0], reason='tournament_log'
+                )
             except clashroyale.RequestError:
-                await asyncio.sleep(0.5)
-                try:
-                    tournament = await self.request(ctx, 'get_tournament', m.content.split(' ')[0], reason='tournament_log')
-                except clashroyale.RequestError:
-                    return
+                return
 
             await self.tournament_sender(
                 ctx,
@@ -326,7 +359,7 @@ class Clash_Royale:
             return
 
         # LINK
-        guild_config = await self.bot.mongo.config.guilds.find_one({'guild_id': str(m.guild.id)}) or {}
+        guild_config = await self.bot.guild_config.get(m.guild.id)
         friend_config = guild_config.get('friend_link')
 
         default = False
@@ -338,7 +371,7 @@ class Clash_Royale:
             ctx = await self.bot.get_context(m)
             ctx.force_cog = self
             if isinstance(ctx.channel, discord.TextChannel):
-                ctx.language = (await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}).get('language', 'messages')
+                ctx.language = await self.bot.guild_config.language(ctx.guild.id)
             else:
                 ctx.language = 'messages'
 
@@ -410,7 +443,7 @@ class Clash_Royale:
             return
 
         if isinstance(ctx.channel, discord.TextChannel):
-            ctx.language = (await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}).get('language', 'messages')
+            ctx.language = await self.bot.guild_config.language(ctx.guild.id)
         else:
             ctx.language = 'messages'
 
@@ -426,20 +459,20 @@ class Clash_Royale:
 
             datadog.statsd.increment('statsy.magic_caching.request', 1, [f'user:{user.id}', f'guild:{guild_id}', 'game:clashroyale'])
 
-            await self.request(ctx, 'get_player_chests', tag)
+            await self.request(ctx, 'get_player_chests', tag, reason='magic caching')
             try:
                 await self.request(ctx, 'get_clan', player.clan.tag, reason='magic caching')
                 await self.request(ctx, 'get_clan_war', player.clan.tag, reason='magic caching')
             except AttributeError:
                 pass
-        except (utils.NoTag, clashroyale.RequestError):
+        except (utils.NoTag, utils.RateLimited, clashroyale.RequestError):
             pass
 
     @commands.guild_only()
     @group()
     async def link(self, ctx):
         """Check your guild's link beautifier status"""
-        guild_config = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
+        guild_config = await self.bot.guild_config.get(ctx.guild.id)
         friend_config = guild_config.get('friend_link')
 
         default = False
@@ -457,9 +490,7 @@ class Clash_Royale:
     @link.command()
     async def enable(self, ctx):
         """Enables link beautifier"""
-        await self.bot.mongo.config.guilds.find_one_and_update(
-            {'guild_id': str(ctx.guild.id)}, {'$set': {'friend_link': True}}, upsert=True
-        )
+        await self.bot.guild_config.update(ctx.guild.id, {'$set': {'friend_link': True}})
         await ctx.send(_('Successfully set link beautifier to be enabled.'))
 
     @commands.guild_only()
@@ -467,9 +498,7 @@ class Clash_Royale:
     @link.command()
     async def disable(self, ctx):
         """Disables link beautifier"""
-        await self.bot.mongo.config.guilds.find_one_and_update(
-            {'guild_id': str(ctx.guild.id)}, {'$set': {'friend_link': False}}, upsert=True
-        )
+        await self.bot.guild_config.update(ctx.guild.id, {'$set': {'friend_link': False}})
         await ctx.send(_('Successfully set link beautifier to be disabled.'))
 
     @commands.guild_only()
@@ -512,15 +541,13 @@ class Clash_Royale:
         except asyncio.TimeoutError:
             return await ctx.send('Command timeout. Do the command again to restart the process.')
 
-        await self.bot.mongo.config.guilds.find_one_and_update(
-            {'guild_id': str(ctx.guild.id)}, {'$set': {
-                'tournament': {
-                    'channel_id': str(channel),
-                    'mention': role,
-                    'types': types
-                }
-            }}, upsert=True
-        )
+        await self.bot.guild_config.update(ctx.guild.id, {'$set': {
+            'tournament': {
+                'channel_id': str(channel),
+                'mention': role,
+                'types': types
+            }
+        }})
         await ctx.send(_('Log set!'))
 
     @commands.has_permissions(manage_guild=True)
@@ -552,7 +579,7 @@ class Clash_Royale:
 
             try:
                 # Update existing config
-                config = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
+                config = await self.bot.guild_config.get(ctx.guild.id)
                 message = None
                 message_id = config.get('claninfo', {}).get('message')
                 if message_id:
@@ -576,15 +603,15 @@ class Clash_Royale:
                     pass
                 return await ctx.send(_('Statsy should have permissions to `Send Messages` and `Add Reactions` in #{}').format(channel.name))
 
-            data = await self.bot.mongo.config.guilds.find_one_and_update({'guild_id': str(ctx.guild.id)}, {'$set': {
+            data = await self.bot.guild_config.update(ctx.guild.id, {'$set': {
                 'claninfo': {
                     'channel': str(channel.id),
                     'message': str(message.id),
-                    'clans': clans
+                    'clans': cleaned_tags
                 }
-            }}, upsert=True, return_document=ReturnDocument.AFTER)
+            }})
 
-            await self.clanupdate(data)
+            await self.clanstats.update(data)
             await ctx.send(_('Configuration complete.'))
 
     @command(aliases=['player'])
@@ -698,25 +725,9 @@ class Clash_Royale:
             if not ctx.guild:
                 return await ctx.send('This command can only be run in servers.')
 
-            db_result = await self.request_db()
-
-            def predicate(x):
-                result = db_result[x]
-                for i in statistics:
-                    result = result[i]
-                return result
-
-            data = sorted(db_result, key=predicate, reverse=True)
-            sorted_result = OrderedDict()
-            for i in data:
-                sorted_result[i] = db_result[i]
-
             tag = await self.resolve_tag(ctx, ctx.author)
-            ems = await cr.format_lb(ctx, sorted_result, tag, emoji_name, *statistics, **kwargs)
-
-            del db_result
-            del data
-            del sorted_result
+            rows = self.leaderboards.top(ctx.guild, statistics, 100, around=f'{ctx.author.id}-{tag}')
+            ems = await cr.format_lb(ctx, rows, self.leaderboards.players, tag, emoji_name, **kwargs)
 
         try:
             await Paginator(ctx, *ems).start()
@@ -882,10 +893,20 @@ class Clash_Royale:
             if not tag:
                 raise utils.InvalidTag
 
+            # a new account may have been looked up before it existed
+            self.api.forget(tag[0])
             player = await self.request(ctx, 'get_player', tag[0])
             player.raw_data['timestamp'] = time.time()
+            try:
+                replaced = await ctx.get_tag('clashroyale', index=index.replace('-', ''))
+            except KeyError:
+                replaced = None
             await ctx.save_tag(tag[0], 'clashroyale', index=index.replace('-', ''))
 
+            if replaced and replaced != tag[0]:
+                self.leaderboards.remove(ctx.author.id, replaced)
+            self.leaderboards.add(ctx.author.id, player.raw_data)
+
             try:
                 default_game = self.bot.default_game[ctx.guild.id]
             except AttributeError:
@@ -995,64 +1016,46 @@ class Clash_Royale:
         await ctx.send(embed=em)
 
     async def get_clans(self, *tags):
-        clans = []
-        wars = []
-        for t in tags:
-            clans.append(await self.request(None, 'get_clan', t, reason='clanstats'))
-            wars.append(await self.request(None, 'get_clan_war', t, reason='clanstats'))
-            await asyncio.sleep(0.5)
-        return clans, wars
-
-    async def clanupdate(self, clan=None):
-        if not clan:
-            guilds = await self.bot.mongo.config.guilds.find({'claninfo': {'$exists': True}}).to_list(None)
-        else:
-            guilds = [clan]
-
-        for g in guilds:
-            m = g['claninfo']
-            clans, wars = await self.get_clans(*m['clans'])
+        """Returns the clan and war of each tag, None for the clans that could not be fetched"""
+        async def get_clan(tag):
+            async with self.clanstats_semaphore:
+                try:
+                    return await asyncio.gather(
+                        self.retry(self.request, None, 'get_clan', tag, reason='clanstats', stale=False),
+                        self.retry(self.request, None, 'get_clan_war', tag, reason='clanstats', stale=False)
+                    )
+                except self.retry.errors + (clashroyale.RequestError, ValueError):
+                    # ValueError: a tag the client rejects
+                    return None
 
-            embed = discord.Embed(title="Clan Statistics!", color=0xf1c40f, timestamp=datetime.utcnow())
-            total_members = 0
+        return await asyncio.gather(*[get_clan(t) for t in tags])
 
-            for i in range(len(clans)):
-                embed.add_field(name=clans[i].name, value=cr.format_clan_stats(clans[i], wars[i]))
-                total_members += len(clans[i].member_list)
+    def format_clanstats(self, stats):
+        embed = discord.Embed(title="Clan Statistics!", color=0xf1c40f, timestamp=datetime.utcnow())
+        total_members = 0
 
-            embed.add_field(name='More Info', value=f"<:clan:376373812012384267> {total_members}/{50*len(clans)}", inline=False)
-            try:
-                channel = self.bot.get_channel(int(m['channel']))
-                message = await channel.get_message(int(m['message']))
-            except AttributeError:
-                message = None
+        for clan, war in stats:
+            embed.add_field(name=clan.name, value=cr.format_clan_stats(clan, war))
+            total_members += len(clan.member_list)
 
-            if not message:
-                try:
-                    message = await self.bot.get_channel(m['channel']).send('Clan Stats')
-                except AttributeError:
-                    await self.bot.mongo.find_one_and_delete({'guild_id': str(g['guild_id'])})
-                    break
-            await message.edit(content='', embed=embed)
-            return message
+        embed.add_field(name='More Info', value=f"<:clan:376373812012384267> {total_members}/{50*len(stats)}", inline=False)
+        return embed
 
     async def clan_update_loop(self):
         await self.bot.wait_until_ready()
         while not self.bot.is_closed():
-            await self.clanupdate()
+            try:
+                await self.clanstats.refresh()
+            except Exception:
+                traceback.print_exc()
             await asyncio.sleep(600)
 
     async def on_raw_reaction_add(self, payload):
-        data = await self.bot.mongo.config.guilds.find_one({'guild_id': str(payload.guild_id), 'claninfo.message': str(payload.message_id)})
-        if data:
-            member = self.bot.get_guild(payload.guild_id).get_member(payload.user_id)
-
-            if member == self.bot.user:
-                return
+        await self.clanstats.on_reaction(payload)
 
-            message = await self.clanupdate(data)
-            await message.clear_reactions()
-            await message.add_reaction(':refresh:477405504512065536')
+    async def on_tag_remove(self, game, user_id):
+        if game == 'clashroyale':
+            self.leaderboards.remove(user_id)
 
 
 def setup(bot):
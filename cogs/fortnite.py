@@ -1,3 +1,4 @@
+import asyncio
 import json
 import time
 import os
@@ -9,7 +10,10 @@ import discord
 from discord.ext import commands
 
 from ext import utils
+from ext.api import APIClient
+from ext.breaker import CircuitBreaker
 from ext.embeds import fortnite
+from ext.ratelimit import TokenBucket
 from ext.paginator import Paginator
 
 from ext.command import cog, command
@@ -36,6 +40,12 @@ class Fortnite:
     def __init__(self, bot):
         self.bot = bot
         self.alias = 'fn'
+        self.api = APIClient(
+            'fortnite',
+            is_missing=lambda data: isinstance(data, dict) and data.get('code') in ('1012', '1006'),
+            limiter=TokenBucket(5, 10)
+        )
+        self.breaker = CircuitBreaker('fortnite', failures=(utils.APIError, aiohttp.ClientError, asyncio.TimeoutError))
         bot.loop.create_task(self.__ainit__())
 
     async def __ainit__(self):
@@ -43,8 +53,7 @@ class Fortnite:
 
     async def __local_check(self, ctx):
         if isinstance(ctx.channel, discord.TextChannel):
-            guild_info = await self.bot.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}
-            return guild_info.get('games', {}).get(self.__class__.__name__, True)
+            return await self.bot.guild_config.game_enabled(ctx.guild.id, self.__class__.__name__)
         else:
             return True
 
@@ -88,28 +97,36 @@ class Fortnite:
             'Authorization': os.getenv('fortnite'),
             'Content-Type': 'application/x-www-form-urlencoded'
         }
-        speed = time.time()
-        async with self.session.post(
-            'https://fortnite-public-api.theapinetwork.com/prod09' + endpoint,
-            data=urlencode(payload), headers=headers
-        ) as resp:
-            speed = speed - time.time()
-            datadog.statsd.increment('statsy.api_latency', 1, [
-                'game:fortnite', f'speed:{speed}', f'method:{endpoint}'
-            ])
-            datadog.statsd.increment('statsy.requests', 1, [
-                'game:fortnite', f'code:{resp.status}', f'method:{endpoint}', f'reason:{reason}'
-            ])
-            if resp.status != 200:
-                raise utils.APIError
-            try:
-                data = await resp.json()
-                if not data:
+
+        async def request():
+            async with self.breaker:
+                return await fetch()
+
+        async def fetch():
+            speed = time.time()
+            async with self.session.post(
+                'https://fortnite-public-api.theapinetwork.com/prod09' + endpoint,
+                data=urlencode(payload), headers=headers
+            ) as resp:
+                speed = time.time() - speed
+                datadog.statsd.increment('statsy.api_latency', 1, [
+                    'game:fortnite', f'speed:{speed}', f'method:{endpoint}'
+                ])
+                datadog.statsd.increment('statsy.requests', 1, [
+                    'game:fortnite', f'code:{resp.status}', f'method:{endpoint}', f'reason:{reason}'
+                ])
+                if resp.status != 200:
                     raise utils.APIError
-            except (json.JSONDecodeError, aiohttp.client_exceptions.ContentTypeError):
-                raise utils.APIError
-            else:
-                return data
+                try:
+                    data = await resp.json()
+                    if not data:
+                        raise utils.APIError
+                except (json.JSONDecodeError, aiohttp.client_exceptions.ContentTypeError):
+                    raise utils.APIError
+                else:
+                    return data
+
+        return await self.api.fetch(request, endpoint, payload, cache=False, reason=reason)
 
     async def get_player_uid(self, ctx, name):
         data = await self.post('/users/id', {'username': name}, reason='get_uid')
@@ -126,6 +143,7 @@ class Fortnite:
     async def save(self, ctx, platform: lower, username: str, index: str='0'):
         """Saves a Fortnite tag to your discord profile."""
         await ctx.save_tag(username, 'fortnite', f'{ctx.author.id}: {platform}', index=index.replace('-', ''))
+        self.api.forget({'username': username})
 
         try:
             default_game = self.bot.default_game[ctx.guild.id]
@@ -13,7 +13,7 @@ import psutil
 from discord.ext import commands
 
 from ext import utils
-from ext.command import command
+from ext.command import command, group
 from ext.paginator import Paginator
 
 from locales.i18n import Translator
@@ -65,6 +65,33 @@ class Bot_Related:
 
             await ctx.send('`Maintenance mode turned on.`')
 
+    @utils.developer()
+    @group(hidden=True, invoke_without_command=True)
+    async def blacklist(self, ctx):
+        """Shows the size of the blacklist"""
+        blacklist = self.bot.blacklist
+        await ctx.send(', '.join(f'{len(getattr(blacklist, i))} {i}' for i in blacklist.types))
+
+    @utils.developer()
+    @blacklist.command(name='add')
+    async def blacklist_add(self, ctx, type_: utils.lower, id: int):
+        """Blacklists a user, channel or guild"""
+        type_ = type_.rstrip('s') + 's'
+        if type_ not in self.bot.blacklist.types:
+            return await ctx.send('Type must be one of: {}'.format(', '.join(self.bot.blacklist.types)))
+        await self.bot.blacklist.add(type_, id)
+        await ctx.send(f'`Blacklisted {id} ({type_}).`')
+
+    @utils.developer()
+    @blacklist.command(name='remove')
+    async def blacklist_remove(self, ctx, type_: utils.lower, id: int):
+        """Removes a user, channel or guild from the blacklist"""
+        type_ = type_.rstrip('s') + 's'
+        if type_ not in self.bot.blacklist.types:
+            return await ctx.send('Type must be one of: {}'.format(', '.join(self.bot.blacklist.types)))
+        await self.bot.blacklist.remove(type_, id)
+        await ctx.send(f'`Removed {id} ({type_}) from the blacklist.`')
+
     @command()
     async def invite(self, ctx):
         """Returns the invite url for the bot."""
@@ -87,13 +114,9 @@ class Bot_Related:
         if not ctx.guild:
             return await ctx.send("Changing prefix isn't allowed in DMs")
         if prefix == '!':
-            await self.bot.mongo.config.guilds.find_one_and_delete(
-                {'guild_id': str(ctx.guild.id)}
-            )
+            await self.bot.guild_config.delete(ctx.guild.id)
         else:
-            await self.bot.mongo.config.guilds.find_one_and_update(
-                {'guild_id': str(ctx.guild.id)}, {'$set': {'prefix': str(prefix)}}, upsert=True
-            )
+            await self.bot.guild_config.update(ctx.guild.id, {'$set': {'prefix': str(prefix)}})
         await ctx.send(_('Changed the prefix to: `{}`').format(prefix))
 
     @command(name='bot', aliases=['about', 'info', 'botto'])
@@ -491,9 +514,7 @@ Total                   :  {len(self.bot.guilds)}```"""))
         if not language or language.lower() not in languages:
             await ctx.send(_('Available languages: {}').format(', '.join([i.title() for i in languages.keys()])))
         else:
-            await self.bot.mongo.config.guilds.find_one_and_update(
-                {'guild_id': str(ctx.guild.id)}, {'$set': {'language': languages[language.lower()]}}, upsert=True
-            )
+            await self.bot.guild_config.update(ctx.guild.id, {'$set': {'language': languages[language.lower()]}})
             await ctx.send(_('Language set.'))
 
     @command()
@@ -516,9 +537,7 @@ Total                   :  {len(self.bot.guilds)}```"""))
             await ctx.send(_('Invalid game. Pick from: {}').format(', '.join(shortcuts.keys())))
         else:
             cog_name = cog.__class__.__name__
-            await self.bot.mongo.config.guilds.find_one_and_update(
-                {'guild_id': str(ctx.guild.id)}, {'$set': {f'games.{cog_name}': True}}, upsert=True
-            )
+            await self.bot.guild_config.update(ctx.guild.id, {'$set': {f'games.{cog_name}': True}})
             await ctx.send('Successfully enabled {}'.format(' '.join(cog_name.split('_'))))
 
     @command()
@@ -541,9 +560,7 @@ Total                   :  {len(self.bot.guilds)}```"""))
             await ctx.send(_('Invalid game. Pick from: {}').format(', '.join(shortcuts.keys())))
         else:
             cog_name = cog.__class__.__name__
-            await self.bot.mongo.config.guilds.find_one_and_update(
-                {'guild_id': str(ctx.guild.id)}, {'$set': {f'games.{cog_name}': False}}, upsert=True
-            )
+            await self.bot.guild_config.update(ctx.guild.id, {'$set': {f'games.{cog_name}': False}})
             await ctx.send('Successfully disabled {}'.format(' '.join(cog_name.split('_'))))
 
     @command()
@@ -568,11 +585,9 @@ Total                   :  {len(self.bot.guilds)}```"""))
             await ctx.send(_('Invalid game. Pick from: {}').format(', '.join(shortcuts.keys())))
         else:
             cog_name = cog.__class__.__name__
-            await self.bot.mongo.config.guilds.find_one_and_update(
-                {'guild_id': guild_id}, {'$set': {'default_game': cog_name}}, upsert=True
-            )
+            await self.bot.guild_config.update(guild_id, {'$set': {'default_game': cog_name}})
             await ctx.send('Successfully set `{}` as the default game.'.format(' '.join(cog_name.split('_'))))
-            self.bot.default_game[ctx.guild.id] = cog_name
+            self.bot.default_game[int(guild_id)] = cog_name
 
     @command()
     async def discord(self, ctx):
@@ -581,12 +596,9 @@ Total                   :  {len(self.bot.guilds)}```"""))
 
     async def on_guild_join(self, g):
         info = ''
-        try:
-            if str(g.id) in self.blacklist['guilds']:
-                await g.leave()
-                info = 'Guild blacklisted!'
-        except AttributeError:
-            pass
+        if g.id in self.bot.blacklist.guilds:
+            await g.leave()
+            info = 'Guild blacklisted!'
 
         texts = ''
         for c in g.text_channels:
@@ -613,9 +625,7 @@ Total                   :  {len(self.bot.guilds)}```"""))
                     break
 
             if language in _.translations.keys():
-                await self.bot.mongo.config.guilds.find_one_and_update(
-                    {'guild_id': str(g.id)}, {'$set': {'language': language}}, upsert=True
-                )
+                await self.bot.guild_config.update(g.id, {'$set': {'language': language}})
         else:
             language = 'en'
 
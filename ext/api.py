@@ -0,0 +1,291 @@
+import asyncio
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+
+import datadog
+from cachetools import TTLCache
+
+from ext import utils
+from ext.ratelimit import INTERACTIVE, PREFETCH, PRIORITIES
+
+
+def freeze(obj):
+    """Turns request parameters into something hashable, dicts are order independent"""
+    if isinstance(obj, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple, set)):
+        return tuple(freeze(i) for i in obj)
+    return obj
+
+
+# tags of every supercell game, O is often typed for 0
+TAG_RE = re.compile(r'(?:#|%23)?([0289PYLQGRJCUVO]{3,})', re.IGNORECASE)
+
+
+def canonical_tag(value):
+    """``#abc``, ``%23ABC`` and ``ABC`` are the same tag, anything else is returned as is"""
+    if isinstance(value, str):
+        match = TAG_RE.fullmatch(value)
+        if match:
+            return match.group(1).upper().replace('O', '0')
+    return value
+
+
+class CacheKey(namedtuple('CacheKey', 'game endpoint tag params')):
+    """Normalised key of an API response
+
+    The tag is the tag segment of a REST endpoint
+    (``clans/%23TAG/currentwar``) or else the first positional parameter,
+    in canonical form. Paths keep a ``{tag}`` placeholder in its place.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, game, endpoint, *args, **kwargs):
+        tag = None
+        if '/' in endpoint:
+            segments = endpoint.split('/')
+            for n, segment in enumerate(segments):
+                if segment.startswith(('#', '%23')):
+                    tag = canonical_tag(segment)
+                    segments[n] = '{tag}'
+                    endpoint = '/'.join(segments)
+                    break
+        if tag is None and args:
+            tag = canonical_tag(freeze(args[0]))
+            args = args[1:]
+
+        if kwargs:
+            return cls(game, endpoint, tag, (freeze(args), freeze(kwargs)))
+        return cls(game, endpoint, tag, freeze(args))
+
+
+def raw(data):
+    """The JSON a response was built from"""
+    data = getattr(data, 'raw_data', data)
+    if isinstance(data, list):
+        data = [getattr(i, 'raw_data', i) for i in data]
+    return data
+
+
+class Body(namedtuple('Body', 'data size')):
+    """A response decoded by the cog, with the length of the body it was read from"""
+
+    __slots__ = ()
+
+
+async def read_json(resp):
+    """Decodes a JSON response into a :class:`Body`"""
+    body = await resp.read()
+    return Body(await resp.json(), len(body))
+
+
+def sizeof(data):
+    """Approximate size in bytes of a response, the length of its body
+
+    Models keep the response they were read from. Only responses without
+    a body to measure, like models built from the disk cache, are
+    measured as their JSON.
+    """
+    first = data[0] if isinstance(data, list) and data else data
+    response = getattr(first, 'response', None) or getattr(first, 'resp', None)
+    body = getattr(response, '_body', None)
+    if body is not None:
+        return len(body)
+    if getattr(response, 'content_length', None):
+        return response.content_length
+
+    data = raw(data)
+    try:
+        return len(json.dumps(data, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(data)
+
+
+class ResponseCache(TTLCache):
+    """TTLCache of ``(response, fetched_at, size)`` bounded by the size of the responses"""
+
+    def __init__(self, budget, ttl):
+        super().__init__(budget, ttl, getsizeof=lambda value: value[2])
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def popitem(self):
+        self.evictions += 1
+        return super().popitem()
+
+
+class APIClient:
+    """Cache-then-fetch front shared by the game cogs, coalescing concurrent misses on a key"""
+
+    def __init__(self, game, *, budget=16 * 1024 ** 2, budgets=None, classify=None,
+                 fresh=180, stale=900, serve_stale=(), store=None, persist=None,
+                 missing=(), is_missing=None, missing_ttl=60, limiter=None):
+        self.game = game
+        # TokenBucket taken with the priority of the reason, prefetches without a token raise utils.RateLimited
+        self.limiter = limiter
+        # lookups of things that do not exist, raising one of missing or
+        # answered with a body is_missing matches; dropped by forget
+        self.missing = TTLCache(10000, missing_ttl)
+        self.missing_errors = missing
+        self.is_missing = is_missing or (lambda data: False)
+        # entries are fresh for fresh seconds and kept for stale seconds
+        self.fresh = fresh
+        # endpoints answered from a stale entry while it is refreshed, the others wait for it
+        self.serve_stale = serve_stale
+        # DiskCache the endpoints in persist are also written to, persist
+        # maps them to the function building a response from its JSON
+        self.store = store
+        self.persist = (persist or {}) if store else {}
+        # maps an endpoint to its name in budgets, serve_stale and persist
+        self.classify = classify or (lambda endpoint: endpoint)
+        # bounded by the size of the responses, endpoints with large payloads get a budget of their own
+        self.caches = {'default': ResponseCache(budget, stale)}
+        for name, size in (budgets or {}).items():
+            self.caches[name] = ResponseCache(size, stale)
+        # key: task fetching it
+        self.inflight = {}
+
+    def get_cache(self, endpoint):
+        return self.caches.get(self.classify(endpoint), self.caches['default'])
+
+    def metrics(self):
+        """Gauges of every cache in the format of ``Statsy.datadog``"""
+        metrics = [('statsy.cache', sum(len(i) for i in self.caches.values()), [f'game:{self.game}'])]
+        for name, cache in self.caches.items():
+            tags = [f'game:{self.game}', f'endpoint:{name}']
+            metrics += [
+                ('statsy.cache.entries', len(cache), tags),
+                ('statsy.cache.bytes', cache.currsize, tags),
+                ('statsy.cache.hits', cache.hits, tags),
+                ('statsy.cache.misses', cache.misses, tags),
+                ('statsy.cache.evictions', cache.evictions, tags)
+            ]
+        metrics.append(('statsy.cache.entries', len(self.missing), [f'game:{self.game}', 'endpoint:missing']))
+        return metrics
+
+    def key(self, endpoint, *args, **kwargs):
+        return CacheKey.build(self.game, endpoint, *args, **kwargs)
+
+    async def fetch(self, request, endpoint, *args, cache=True, stale=None, reason='command', **kwargs):
+        """Returns the response for ``endpoint`` with the given parameters
+
+        ``request`` is a coroutine function doing the upstream call, it is
+        only called when the response is not cached (or is stale) and is
+        not already being fetched. Pass ``cache=False`` to only coalesce
+        and ``stale`` to override whether the endpoint is in ``serve_stale``.
+        """
+        if stale is None:
+            stale = self.classify(endpoint) in self.serve_stale
+        key = self.key(endpoint, *args, **kwargs)
+        try:
+            missing = self.missing[key]
+        except KeyError:
+            pass
+        else:
+            if isinstance(missing, Exception):
+                raise missing.with_traceback(None)
+            return missing
+
+        responses = self.get_cache(endpoint)
+        entry = responses.get(key)
+        if entry is None and cache and self.classify(endpoint) in self.persist:
+            entry = await self.restore(key, endpoint)
+
+        if entry is None:
+            responses.misses += 1
+        else:
+            data, fetched_at, _ = entry
+            if time.monotonic() - fetched_at <= self.fresh:
+                responses.hits += 1
+                return data
+            if stale:
+                responses.hits += 1
+                self.start(key, request, endpoint, cache, reason)
+                return data
+            responses.misses += 1
+
+        task = self.start(key, request, endpoint, cache, reason)
+        if task is None:
+            raise utils.RateLimited
+        try:
+            # one caller being cancelled must not cancel the fetch the others are awaiting
+            return await asyncio.shield(task)
+        except (asyncio.CancelledError, *self.missing_errors):
+            raise
+        except Exception:
+            if entry is None:
+                raise
+            # the upstream is down, an old answer is better than none
+            return entry[0]
+
+    def forget(self, tag):
+        """Drops the cached lookups of ``tag`` that found nothing"""
+        tag = canonical_tag(freeze(tag))
+        for key in [i for i in self.missing.keys() if i.tag == tag]:
+            self.missing.pop(key, None)
+
+    async def restore(self, key, endpoint):
+        """Moves a response from the disk cache into memory"""
+        found = await self.store.get(key)
+        if found is None:
+            return None
+
+        data, age, size = found
+        entry = (self.persist[self.classify(endpoint)](data), time.monotonic() - age, size)
+        self.remember(key, endpoint, entry)
+        return entry
+
+    def remember(self, key, endpoint, entry):
+        try:
+            self.get_cache(endpoint)[key] = entry
+        except ValueError:
+            # larger than the whole budget
+            pass
+
+    def start(self, key, request, endpoint, cache, reason):
+        """Returns the task fetching ``key``, starting it if there is none.
+        Returns None if it is a prefetch that was dropped.
+        """
+        try:
+            task = self.inflight[key]
+        except KeyError:
+            priority = PRIORITIES.get(reason, INTERACTIVE)
+            if priority == PREFETCH and self.limiter and not self.limiter.take(PREFETCH):
+                datadog.statsd.increment('statsy.requests.shed', 1, [f'game:{self.game}', f'method:{endpoint}'])
+                return None
+            task = self.inflight[key] = asyncio.ensure_future(self._fetch(key, request, endpoint, cache, priority))
+            # the error is raised to the callers, don't log it again if they all left
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            datadog.statsd.increment('statsy.requests.coalesced', 1, [f'game:{self.game}', f'method:{endpoint}'])
+        return task
+
+    async def _fetch(self, key, request, endpoint, cache, priority):
+        try:
+            if self.limiter and priority != PREFETCH:
+                await self.limiter.acquire(priority)
+            try:
+                data = await request()
+            except self.missing_errors as e:
+                self.missing[key] = e
+                raise
+
+            size = None
+            if isinstance(data, Body):
+                data, size = data
+
+            if self.is_missing(data):
+                self.missing[key] = data
+            elif cache:
+                self.remember(key, endpoint, (data, time.monotonic(), size or sizeof(data)))
+                if self.classify(endpoint) in self.persist:
+                    self.store.set(key, raw(data))
+            return data
+        finally:
+            self.inflight.pop(key, None)
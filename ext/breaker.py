@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+import datadog
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Stops calling an upstream API that is down, used as ``async with breaker:``"""
+
+    def __init__(self, name, *, failures=(), trip_on=(), threshold=5, cooldown=30):
+        self.name = name
+        # threshold consecutive failures, or one error in trip_on (a maintenance break), open the breaker
+        self.failures = failures + trip_on
+        self.trip_on = trip_on
+        self.threshold = threshold
+        # requests fail straight away with the error that opened it for
+        # cooldown seconds, then a single probe is let through
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.count = 0
+        self.error = None
+        self.opened_at = 0
+
+    async def __aenter__(self):
+        if self.state == CLOSED:
+            return self
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            return self
+        # open, or half-open with the probe still running
+        raise self.error.with_traceback(None)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.state = CLOSED
+            self.count = 0
+        elif isinstance(exc, self.failures):
+            self.count += 1
+            if self.state == HALF_OPEN or self.count >= self.threshold or isinstance(exc, self.trip_on):
+                self.trip(exc)
+        elif self.state == HALF_OPEN:
+            if isinstance(exc, asyncio.CancelledError):
+                # let the next request probe instead
+                self.state = OPEN
+            else:
+                # the upstream answered, even if it was with a not found
+                self.state = CLOSED
+                self.count = 0
+        return False
+
+    def trip(self, error):
+        if self.state != OPEN:
+            datadog.statsd.increment('statsy.breaker.trips', 1, [f'upstream:{self.name}'])
+        self.state = OPEN
+        self.error = error
+        self.opened_at = time.monotonic()
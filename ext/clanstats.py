@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+import traceback
+
+import datadog
+import discord
+from cachetools import TTLCache
+
+from ext.api import canonical_tag
+
+
+class ClanStats:
+    """Keeps the clan statistics message of every guild up to date"""
+
+    def __init__(self, bot, game, field, tags, *, fetch, render, concurrency=10, debounce=10):
+        self.bot = bot
+        self.game = game
+        # key of the guild config holding the channel and message, and the clans under tags
+        self.field = field
+        self.tags = tags
+        # the cog's stats of each tag it is given, in order, None for the clans it could not fetch
+        self.fetch = fetch
+        # builds the embed out of the stats of a guild's clans
+        self.render = render
+        # message edits running at once
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # guild_id: message
+        self.messages = {}
+        # message id: digest of the embed it shows, unchanged embeds are not edited again
+        self.digests = {}
+        # message id: guild_id, None until loaded
+        self.index = None
+        # messages being refreshed, or refreshed less than debounce seconds ago, ignore reactions
+        self.refreshing = set()
+        self.refreshed = TTLCache(10000, debounce)
+
+    def clan_tags(self, config):
+        return [canonical_tag(t) for t in config[self.field][self.tags]]
+
+    async def refresh(self):
+        """Updates the message of every guild, fetching each clan once"""
+        start = time.monotonic()
+        guilds = await self.bot.mongo.config.guilds.find({self.field: {'$exists': True}}).to_list(None)
+        self.index = {int(g[self.field]['message']): g['guild_id'] for g in guilds}
+        tags = {t for g in guilds for t in self.clan_tags(g)}
+        stats = await self.fetch_all(tags)
+
+        async def update(config):
+            async with self.semaphore:
+                return await self.update(config, stats)
+
+        # one guild failing must not keep the others from being updated
+        messages = await asyncio.gather(*[update(g) for g in guilds], return_exceptions=True)
+        errors = [m for m in messages if isinstance(m, Exception)]
+        for error in errors:
+            traceback.print_exception(type(error), error, error.__traceback__)
+
+        duration = time.monotonic() - start
+        metric_tags = [f'game:{self.game}']
+        datadog.statsd.gauge('statsy.clanstats.duration', duration, metric_tags)
+        datadog.statsd.gauge('statsy.clanstats.guilds', len(guilds), metric_tags)
+        datadog.statsd.gauge('statsy.clanstats.clans', len(stats), metric_tags)
+        datadog.statsd.gauge('statsy.clanstats.failures', len(tags) - len(stats), metric_tags)
+        datadog.statsd.gauge('statsy.clanstats.throughput', len(stats) / duration if duration else 0, metric_tags)
+        datadog.statsd.gauge('statsy.clanstats.errors', len(errors), metric_tags)
+        datadog.statsd.increment('statsy.clanstats.updates', len([m for m in messages if m and not isinstance(m, Exception)]), metric_tags)
+
+    async def fetch_all(self, tags):
+        """Returns ``{tag: stats}`` of the clans that could be fetched"""
+        tags = list(tags)
+        results = await self.fetch(*tags)
+        return {tag: stats for tag, stats in zip(tags, results) if stats is not None}
+
+    async def update(self, config, stats=None):
+        """Edits the message of a guild. Returns it, or None if it was not updated."""
+        tags = self.clan_tags(config)
+        if stats is None:
+            stats = await self.fetch_all(set(tags))
+        if any(t not in stats for t in tags):
+            # keeps its last message until the next cycle
+            return None
+
+        embed = self.render([stats[t] for t in tags])
+        try:
+            message = await self.get_message(config)
+            if message is None:
+                return None
+
+            digest = self.digest(embed)
+            if self.digests.get(message.id) == digest:
+                datadog.statsd.increment('statsy.clanstats.unchanged', 1, [f'game:{self.game}'])
+                return message
+            await message.edit(content='', embed=embed)
+        except discord.NotFound:
+            # deleted since it was fetched, sent again next time
+            self.forget(config['guild_id'])
+            return None
+        except discord.HTTPException:
+            return None
+
+        self.digests[message.id] = digest
+        return message
+
+    async def get_message(self, config):
+        """Returns the message of a guild, sending it again if it was deleted"""
+        guild_id = config['guild_id']
+        info = config[self.field]
+        if self.index is not None:
+            self.index[int(info['message'])] = guild_id
+        message = self.messages.get(guild_id)
+        if message is not None and message.id == int(info['message']):
+            return message
+
+        channel = self.bot.get_channel(int(info['channel']))
+        if channel is None:
+            if self.bot.get_guild(int(guild_id)):
+                # the channel was deleted
+                self.forget(guild_id)
+                await self.bot.guild_config.update(guild_id, {'$unset': {self.field: ''}})
+            return None
+
+        try:
+            message = await channel.get_message(int(info['message']))
+        except discord.NotFound:
+            message = await channel.send('Clan Stats')
+            await self.bot.guild_config.update(guild_id, {'$set': {f'{self.field}.message': str(message.id)}})
+            if self.index is not None:
+                self.index.pop(int(info['message']), None)
+                self.index[message.id] = guild_id
+        self.forget(guild_id)
+        self.messages[guild_id] = message
+        return message
+
+    async def load_index(self):
+        guilds = self.bot.mongo.config.guilds.find(
+            {self.field: {'$exists': True}}, {'guild_id': 1, f'{self.field}.message': 1}
+        )
+        self.index = {int(g[self.field]['message']): g['guild_id'] async for g in guilds}
+
+    async def on_reaction(self, payload):
+        """Refreshes a message when a reaction is added to it"""
+        if payload.user_id == self.bot.user.id:
+            return
+        if self.index is None:
+            await self.load_index()
+
+        message_id = payload.message_id
+        guild_id = self.index.get(message_id)
+        if guild_id is None or message_id in self.refreshing or message_id in self.refreshed:
+            return
+
+        self.refreshing.add(message_id)
+        try:
+            config = await self.bot.guild_config.get(guild_id)
+            if config.get(self.field, {}).get('message') != str(message_id):
+                # moved to another message
+                self.index.pop(message_id, None)
+                return
+
+            message = await self.update(config)
+            if message:
+                await message.clear_reactions()
+                await message.add_reaction(':refresh:477405504512065536')
+        finally:
+            self.refreshing.discard(message_id)
+            self.refreshed[message_id] = True
+
+    def forget(self, guild_id):
+        message = self.messages.pop(guild_id, None)
+        if message is not None:
+            self.digests.pop(message.id, None)
+
+    @staticmethod
+    def digest(embed):
+        data = embed.to_dict()
+        # changes every time it is rendered
+        data.pop('timestamp', None)
+        return hash(json.dumps(data, sort_keys=True))
@@ -0,0 +1,154 @@
+from cachetools import TTLCache
+from pymongo import ReturnDocument
+
+
+class GuildConfig:
+    """In-process cache of the documents in ``config.guilds``
+
+    Every setting of a guild (prefix, language, games, default_game,
+    friend_link, tournament, claninfo...) lives in one document, so a
+    single lookup serves all of them. Entries are held in a bounded
+    LRU with a TTL and every write made through :meth:`update` or
+    :meth:`delete` is written through to the cache.
+    """
+
+    def __init__(self, collection, *, maxsize=5000, ttl=900):
+        self.collection = collection
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def get(self, guild_id):
+        """Returns the config document of a guild, an empty dict if there is none"""
+        if guild_id is None:
+            return {}
+
+        key = str(guild_id)
+        try:
+            return self.cache[key]
+        except KeyError:
+            data = await self.collection.find_one({'guild_id': key}) or {}
+            self.cache[key] = data
+            return data
+
+    async def update(self, guild_id, update):
+        """Applies an update to the guild's document and caches the result"""
+        key = str(guild_id)
+        data = await self.collection.find_one_and_update(
+            {'guild_id': key}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self.cache[key] = data
+        return data
+
+    async def delete(self, guild_id):
+        """Deletes the guild's document"""
+        key = str(guild_id)
+        await self.collection.find_one_and_delete({'guild_id': key})
+        self.cache[key] = {}
+
+    def invalidate(self, guild_id):
+        """Drops the guild from the cache, the next lookup will hit the database"""
+        self.cache.pop(str(guild_id), None)
+
+    async def prefix(self, guild_id):
+        return (await self.get(guild_id)).get('prefix', '!')
+
+    async def language(self, guild_id):
+        return (await self.get(guild_id)).get('language', 'messages')
+
+    async def game_enabled(self, guild_id, game):
+        return (await self.get(guild_id)).get('games', {}).get(game, True)
+
+    def invalidate_document(self, _id):
+        """Drops whichever cached guild is backed by the document ``_id``"""
+        for key, data in list(self.cache.items()):
+            if data.get('_id') == _id:
+                self.cache.pop(key, None)
+
+    def refresh(self, data):
+        """Replaces a cached document with a newer version of itself.
+        Documents of guilds that are not cached are ignored.
+        """
+        key = data['guild_id']
+        if key in self.cache:
+            self.cache[key] = data
+
+
+class PlayerTags:
+    """In-process cache of the saved tags in the ``player_tags`` database
+
+    Each game has its own collection, the cache is keyed by
+    ``(game, user_id)`` and caches misses as an empty dict.
+    """
+
+    def __init__(self, database, *, maxsize=10000, ttl=900):
+        self.database = database
+        self.cache = TTLCache(maxsize, ttl)
+
+    async def get(self, game, user_id):
+        key = (game, str(user_id))
+        try:
+            return self.cache[key]
+        except KeyError:
+            data = await self.database[game].find_one({'user_id': key[1]}) or {}
+            self.cache[key] = data
+            return data
+
+    async def update(self, game, user_id, update):
+        key = (game, str(user_id))
+        data = await self.database[game].find_one_and_update(
+            {'user_id': key[1]}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        self.cache[key] = data
+        return data
+
+    async def delete(self, game, user_id):
+        key = (game, str(user_id))
+        await self.database[game].find_one_and_delete({'user_id': key[1]})
+        self.cache[key] = {}
+
+    def invalidate(self, game, user_id):
+        self.cache.pop((game, str(user_id)), None)
+
+    def invalidate_document(self, game, _id):
+        for key, data in list(self.cache.items()):
+            if key[0] == game and data.get('_id') == _id:
+                self.cache.pop(key, None)
+
+    def refresh(self, game, data):
+        key = (game, data['user_id'])
+        if key in self.cache:
+            self.cache[key] = data
+
+
+class Blacklist:
+    """In-memory copy of the ``blacklist`` document in ``config.admin``
+
+    The database stores ids as strings, here they are kept as sets of
+    ints so a message can be checked without allocating anything.
+    """
+
+    types = ('users', 'channels', 'guilds')
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.users = set()
+        self.channels = set()
+        self.guilds = set()
+
+    def load(self, data):
+        data = data or {}
+        for type_ in self.types:
+            setattr(self, type_, {int(i) for i in data.get(type_, [])})
+
+    async def refresh(self):
+        self.load(await self.collection.find_one({'_id': 'blacklist'}))
+
+    def is_blacklisted(self, message):
+        return message.author.id in self.users or message.channel.id in self.channels or getattr(message.guild, 'id', None) in self.guilds
+
+    async def add(self, type_, id):
+        await self.collection.update_one({'_id': 'blacklist'}, {'$addToSet': {type_: str(id)}}, upsert=True)
+        getattr(self, type_).add(id)
+
+    async def remove(self, type_, id):
+        await self.collection.update_one({'_id': 'blacklist'}, {'$pull': {type_: str(id)}})
+        getattr(self, type_).discard(id)
@@ -2,18 +2,32 @@ import io
 from urllib.parse import urlparse
 
 import discord
-import pymongo
 from colorthief import ColorThief
 from discord.ext import commands
 
+from locales.i18n import set_language
+
 
 class CustomContext(commands.Context):
     """Custom Context class to provide utility."""
+    _language = 'messages'
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.session = self.bot.session
         self.force_cog = None
 
+    @property
+    def language(self):
+        """The language of the context's guild"""
+        return self._language
+
+    @language.setter
+    def language(self, value):
+        """Also binds the language for translations made in this context"""
+        self._language = value
+        set_language(value)
+
     @property
     def cog(self):
         """Returns the cog associated with this context's command. None if it does not exist."""
@@ -65,25 +79,16 @@ class CustomContext(commands.Context):
 
     async def save_tag(self, tag, game, id=None, *, index='0'):
         id = id or self.author.id
-
-        await self.bot.mongo.player_tags[game].find_one_and_update(
-            {
-                'user_id': str(id)
-            },
-            {
-                '$set': {f'tag.{index}': tag}
-            },
-            upsert=True,
-            return_document=pymongo.ReturnDocument.AFTER
-        )
+        await self.bot.player_tags.update(game, id, {'$set': {f'tag.{index}': tag}})
 
     async def remove_tag(self, game, id=None):
         id = id or self.author.id
-        await self.bot.mongo.player_tags[game].find_one_and_delete({'user_id': id})
+        await self.bot.player_tags.delete(game, id)
+        self.bot.dispatch('tag_remove', game, id)
 
     async def get_tag(self, game, id=None, *, index='0'):
         id = id or self.author.id
-        data = await self.bot.mongo.player_tags[game].find_one({'user_id': str(id)})
+        data = await self.bot.player_tags.get(game, id)
 
         if index == 'all':
             return (data or {}).get('tag', [])
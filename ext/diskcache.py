@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DiskCache:
+    """Second level cache of raw API responses in SQLite, kept across restarts and deploys"""
+
+    def __init__(self, path, *, max_bytes=64 * 1024 ** 2, ttl=900):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # cap of the stored payloads, see _compact
+        self.max_bytes = max_bytes
+        # seconds a response is kept after it was fetched
+        self.ttl = ttl
+        # every query runs on this one thread
+        self.executor = ThreadPoolExecutor(1)
+
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        # must be set before the table is created to take effect
+        self.db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(key TEXT PRIMARY KEY, data TEXT, size INTEGER, fetched REAL, expires REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+        self.size = 0
+        self._compact()
+
+    def _run(self, func, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+    async def get(self, key):
+        """Returns ``(raw, age, size)`` of an unexpired response, None if there is none"""
+        return await self._run(self._get, repr(key))
+
+    def set(self, key, raw):
+        """Stores a response in the background"""
+        return self._run(self._set, repr(key), raw)
+
+    def close(self):
+        self.executor.shutdown()
+        self.db.close()
+
+    def _get(self, key):
+        now = time.time()
+        try:
+            row = self.db.execute(
+                'SELECT data, fetched, size FROM responses WHERE key = ? AND expires > ?', (key, now)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), now - row[1], row[2]
+
+    def _set(self, key, raw):
+        now = time.time()
+        try:
+            data = json.dumps(raw, default=str)
+        except (TypeError, ValueError):
+            return
+
+        try:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                (key, data, len(data), now, now + self.ttl)
+            )
+        except sqlite3.Error:
+            return
+
+        # replaced rows are counted twice until the next compaction
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self._compact()
+
+    def _compact(self):
+        """Deletes expired responses, then the oldest ones until 3/4 of the cap is used"""
+        try:
+            self.db.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),))
+            self.size = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            target = self.max_bytes * 3 // 4
+            while self.size > target:
+                rows = self.db.execute('SELECT key, size FROM responses ORDER BY expires LIMIT 100').fetchall()
+                if not rows:
+                    break
+                self.db.executemany('DELETE FROM responses WHERE key = ?', [(key,) for key, _ in rows])
+                self.size -= sum(size for _, size in rows)
+            self.db.execute('PRAGMA incremental_vacuum')
+        except sqlite3.Error:
+            pass
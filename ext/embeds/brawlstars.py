@@ -8,7 +8,7 @@ from datetime import datetime
 import box
 import discord
 
-from ext.utils import random_color, camel_case, get_stack_variable
+from ext.utils import random_color, camel_case
 from ext.utils import e as emoji
 from locales.i18n import Translator
 
@@ -43,16 +43,31 @@ def format_timestamp(seconds: int):
     return timeleft
 
 
+# brawler name -> emoji name, built from the constants by index_brawlers
+brawler_emojis = {}
+
+
+def index_brawlers(constants):
+    """Rebuilds the brawler index used by e()"""
+    thumbnails = {}
+    for i in constants.player_thumbnails:
+        thumbnails.setdefault(i.required_hero, i.sc_id)
+
+    index = {}
+    for i in constants.characters:
+        if i.name in thumbnails:
+            index.setdefault(i.name.lower(), thumbnails[i.name])
+            if i.tID:
+                index.setdefault(i.tID.lower(), thumbnails[i.name])
+
+    brawler_emojis.clear()
+    brawler_emojis.update(index)
+
+
 def e(name):
     """Wrapper to the default emoji function to support brawler names"""
-    cog = getattr(get_stack_variable('ctx'), 'cog', None) or get_stack_variable('self')
     name = str(name).lower()
-    try:
-        brawler = next(i for i in cog.constants.characters if i.name.lower() == name or (i.tID or '').lower() == name)
-    except StopIteration:
-        return emoji(name)
-    else:
-        return emoji(next(i for i in cog.constants.player_thumbnails if i.required_hero == brawler.name).sc_id)
+    return emoji(brawler_emojis.get(name, name))
 
 
 def format_0(val):
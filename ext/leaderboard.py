@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import time
+import traceback
+from collections import defaultdict
+
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import PyMongoError
+
+from ext.api import canonical_tag
+
+# statistics shown by the leaderboards, besides the first achievement
+FIELDS = ('trophies', 'expLevel', 'totalDonations', 'challengeCardsWon', 'challengeMaxWins', 'clanCardsCollected')
+
+
+def compact(data, timestamp):
+    """The parts of a player's data the leaderboards use, as of ``timestamp``"""
+    player = {i: data[i] for i in ('name', 'tag', *FIELDS) if i in data}
+    achievements = data.get('achievements')
+    if achievements:
+        player['achievements'] = [{'value': achievements[0].get('value')}]
+    player['timestamp'] = timestamp
+    return player
+
+
+class Leaderboard:
+    """Saved players of the leaderboards, kept up to date incrementally"""
+
+    def __init__(self, collection, *, load=None, interval=30, reload=3600):
+        # where the players fetched from the API are written to survive restarts
+        self.collection = collection
+        # coroutine function returning the Firebase dump, merged every reload seconds
+        self.load = load
+        # seconds between the writes of the queued players
+        self.interval = interval
+        self.reload = reload
+        # {user_id}-{tag}: statistics, like the Firebase database
+        self.players = {}
+        # user_id / tag: keys, the players of a guild are found without going through all of them
+        self.users = defaultdict(set)
+        self.tags = defaultdict(set)
+        # statistics: {key: value}, read once per update of a player
+        self.values = defaultdict(dict)
+        # key: player, waiting for the next flush
+        self.pending = {}
+        # keys of removed tags, deleted on the next flush and left out of later dumps
+        self.deleted = set()
+        self.removed = set()
+
+    async def run(self):
+        """Loads the stored players and the dump, then keeps them up to date until cancelled"""
+        try:
+            async for data in self.collection.find():
+                key = data.pop('_id')
+                if self.outdated(key, data['timestamp']):
+                    self.set(key, data)
+        except PyMongoError:
+            pass
+
+        loaded = None
+        while True:
+            if self.load is not None and (loaded is None or time.monotonic() - loaded >= self.reload):
+                loaded = time.monotonic()
+                await self.refresh()
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def refresh(self):
+        """Merges a new dump of the Firebase database"""
+        try:
+            self.merge(await self.load())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # kept up to date from the API until the next reload
+            traceback.print_exc()
+
+    def set(self, key, data):
+        self.players[key] = data
+        user_id, tag = key.split('-', 1)
+        self.users[int(user_id)].add(key)
+        self.tags[canonical_tag(tag)].add(key)
+        for values in self.values.values():
+            values.pop(key, None)
+
+    def discard(self, key):
+        if self.players.pop(key, None) is None:
+            return
+        user_id, tag = key.split('-', 1)
+        for index, value in ((self.users, int(user_id)), (self.tags, canonical_tag(tag))):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+        for values in self.values.values():
+            values.pop(key, None)
+
+    def outdated(self, key, timestamp):
+        """Whether data of ``timestamp`` should replace the player of ``key``"""
+        if key in self.removed:
+            return False
+        current = self.players.get(key)
+        return current is None or timestamp >= current['timestamp']
+
+    def merge(self, snapshot):
+        """Adds the players of a dump of the Firebase database, unless ours are newer"""
+        for key, data in snapshot.items():
+            # rows without a timestamp are the oldest
+            timestamp = data.get('timestamp', 0)
+            if self.outdated(key, timestamp):
+                self.set(key, compact(data, timestamp))
+
+    def record(self, data):
+        """Queues the statistics of a player fetched from the API, if anyone saved it"""
+        keys = self.tags.get(canonical_tag(data.get('tag')))
+        if keys:
+            player = compact(data, time.time())
+            for key in keys:
+                self.pending[key] = player
+
+    def add(self, user_id, data):
+        """Queues a player saved by ``user_id``"""
+        key = f"{user_id}-{canonical_tag(data['tag'])}"
+        self.removed.discard(key)
+        self.deleted.discard(key)
+        self.pending[key] = compact(data, time.time())
+
+    def remove(self, user_id, tag=None):
+        """Drops the players saved by ``user_id``, or only ``tag``"""
+        keys = set(self.users.get(int(user_id), ()))
+        keys.update(i for i in self.pending if i.startswith(f'{user_id}-'))
+        if tag is not None:
+            tag = canonical_tag(tag)
+            keys = {i for i in keys if canonical_tag(i.split('-', 1)[1]) == tag}
+
+        for key in keys:
+            self.discard(key)
+            self.pending.pop(key, None)
+        self.removed.update(keys)
+        self.deleted.update(keys)
+
+    async def flush(self):
+        if not self.pending and not self.deleted:
+            return
+        pending, self.pending = self.pending, {}
+        deleted, self.deleted = self.deleted, set()
+        for key, data in pending.items():
+            self.set(key, data)
+
+        requests = [ReplaceOne({'_id': key}, data, upsert=True) for key, data in pending.items()]
+        requests += [DeleteOne({'_id': key}) for key in deleted]
+        try:
+            await self.collection.bulk_write(requests, ordered=False)
+        except PyMongoError:
+            pass
+
+    def value(self, key, statistics):
+        values = self.values[statistics]
+        try:
+            return values[key]
+        except KeyError:
+            value = self.players[key]
+            try:
+                for i in statistics:
+                    value = value[i]
+            except (KeyError, IndexError, TypeError):
+                value = None
+            values[key] = value
+            return value
+
+    def members(self, guild):
+        """Keys of the players saved by members of ``guild``"""
+        if len(guild.members) < len(self.users):
+            users = (self.users.get(m.id, ()) for m in guild.members)
+        else:
+            users = (keys for user_id, keys in self.users.items() if guild.get_member(user_id))
+        return [key for keys in users for key in keys]
+
+    def top(self, guild, statistics, k, around=None):
+        """Returns ``[(value, key)]`` of the ``k`` best players of ``guild``, best first
+
+        The list goes on past ``k`` to include ``around`` and the two
+        players after it.
+        """
+        rows = []
+        for key in self.members(guild):
+            value = self.value(key, statistics)
+            if value is not None:
+                rows.append((value, key))
+
+        if around in self.players:
+            own = (self.value(around, statistics), around)
+            if own[0] is not None:
+                k = max(k, sum(1 for row in rows if row > own) + 3)
+        return heapq.nlargest(k, rows)
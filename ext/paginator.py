@@ -160,7 +160,7 @@ class WikiPaginator(Paginator):
         super().__init__(ctx, *embeds, **kwargs)
         self.brawler_power = brawler_power
         if self.brawler_power:
-            self.emojis[str(e('28000000', ctx=self.ctx))] = 'jump_to_player'
+            self.emojis[str(e('28000000'))] = 'jump_to_player'
 
     async def exec_jump_to_player(self):
         self.page = self.brawler_power
@@ -0,0 +1,22 @@
+class PrefixMatcher:
+    """Precompiled set of command prefixes
+
+    Most messages are not meant for the bot, those are rejected by
+    looking at their first character only.
+    """
+
+    __slots__ = ('prefixes', 'initials')
+
+    def __init__(self, prefixes):
+        # Longest first so a prefix is never shadowed by a shorter one
+        self.prefixes = tuple(sorted({p for p in prefixes if p}, key=len, reverse=True))
+        self.initials = frozenset(p[0] for p in self.prefixes)
+
+    def match(self, content):
+        """Returns the prefix ``content`` starts with, None if there is none"""
+        if content[:1] not in self.initials:
+            return None
+
+        for prefix in self.prefixes:
+            if content.startswith(prefix):
+                return prefix
@@ -0,0 +1,49 @@
+import asyncio
+import time
+
+INTERACTIVE = 0
+REFRESH = 1
+PREFETCH = 2
+
+# reason= of the requests that are not answering a command
+PRIORITIES = {
+    'magic caching': PREFETCH,
+    'clanstats': REFRESH,
+    'tournament_log': REFRESH
+}
+
+
+class TokenBucket:
+    """Outbound request limit of a game API
+
+    Holds up to ``burst`` tokens refilled at ``rate`` per second and
+    every upstream request takes one. Lower priorities can only draw the
+    bucket down to their reserve so commands always get the last tokens:
+    refreshes wait for the bucket to fill up again, prefetches are
+    dropped.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.reserves = {INTERACTIVE: 0, REFRESH: burst / 4, PREFETCH: burst / 2}
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, priority):
+        """Takes a token if there is one left for ``priority``"""
+        self.refill()
+        if self.tokens - 1 >= self.reserves[priority]:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, priority):
+        """Waits until a token can be taken"""
+        while not self.take(priority):
+            await asyncio.sleep((1 + self.reserves[priority] - self.tokens) / self.rate)
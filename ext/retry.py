@@ -0,0 +1,35 @@
+import asyncio
+import random
+import time
+
+
+class Retry:
+    """Bounded retry policy for background requests
+
+    Calls the coroutine function again when it raises one of ``errors``,
+    sleeping a random time between 0 and ``base * 2 ** attempt`` seconds
+    (capped at ``cap``) in between. Gives up, re-raising the last error,
+    after ``attempts`` calls or when the next one would start later than
+    ``deadline`` seconds after the first.
+    """
+
+    def __init__(self, *errors, attempts=5, base=1, cap=60, deadline=300):
+        self.errors = errors
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    async def __call__(self, func, *args, **kwargs):
+        start = time.monotonic()
+        for attempt in range(self.attempts):
+            try:
+                return await func(*args, **kwargs)
+            except self.errors:
+                delay = self.backoff(attempt)
+                if attempt + 1 == self.attempts or time.monotonic() + delay - start > self.deadline:
+                    raise
+                await asyncio.sleep(delay)
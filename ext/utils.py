@@ -1,6 +1,5 @@
 import asyncio
 import functools
-import inspect
 import random
 import re
 
@@ -35,6 +34,11 @@ class NoTag(Exception):
     pass
 
 
+class RateLimited(Exception):
+    """Raised when a prefetch is dropped to stay within the API limits."""
+    pass
+
+
 def has_perms():
     perms = {
         'send_messages': True,
@@ -75,41 +79,33 @@ def asyncexecutor(loop=None, executor=None):
     return decorator
 
 
-def get_stack_variable(name):
-    stack = inspect.stack()
-    try:
-        for frames in stack:
-            try:
-                frame = frames[0]
-                current_locals = frame.f_locals
-                if name in current_locals:
-                    return current_locals[name]
-            finally:
-                del frame
-    finally:
-        del stack
+# name -> emoji, built from the emoji servers by index_emojis
+_emojis = {}
+
 
+def index_emojis(emojis):
+    """Rebuilds the emoji index used by e()"""
+    index = {}
+    for emoji in emojis:
+        index.setdefault(emoji.name, emoji)
+    _emojis.clear()
+    _emojis.update(index)
 
-def e(name, *, should_format=True, ctx=None):
-    ctx = ctx or get_stack_variable('ctx') or get_stack_variable('self')
 
+@functools.lru_cache(maxsize=4096)
+def format_emoji_name(name):
+    name = name.lower()
+    for char in ('.', ' ', '_', '-'):
+        name = name.replace(char, '')
+    return name.replace('chestgold', 'chestgolden')
+
+
+def e(name, *, should_format=True):
     name = str(name)
     if should_format:
-        name = name.lower()
-        replace = {
-            # new: to_replace
-            '': ['.', ' ', '_', '-'],
-            'chestgold': 'chestgolden'
-        }
-        for key, value in replace.items():
-            if isinstance(value, list):
-                for val in value:
-                    name = name.replace(val, key)
-            else:
-                name = name.replace(value, key)
-
-    emoji = discord.utils.get(ctx.bot.game_emojis, name=name)
-    return emoji or name
+        name = format_emoji_name(name)
+
+    return _emojis.get(name, name)
 
 
 def cdir(obj):
@@ -0,0 +1,121 @@
+import asyncio
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+
+class ConfigWatcher:
+    """Pushes database changes into the in-process config caches
+
+    Uses change streams over ``config.guilds``, ``config.admin`` and the
+    ``player_tags`` database so edits made by other processes (or by hand)
+    reach :class:`ext.config.GuildConfig`, :class:`ext.config.PlayerTags`
+    and :class:`ext.config.Blacklist`.
+    Deployments without a replica set do not support change streams,
+    those fall back to re-reading every cached document each
+    ``poll_interval`` seconds.
+    """
+
+    def __init__(self, bot, *, poll_interval=60):
+        self.bot = bot
+        self.poll_interval = poll_interval
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [
+            self.bot.loop.create_task(self.watch(self.bot.mongo.config.guilds, self.on_guild_change, self.poll_guilds)),
+            self.bot.loop.create_task(self.watch(self.bot.mongo.player_tags, self.on_tag_change, self.poll_tags)),
+            self.bot.loop.create_task(self.watch(self.bot.mongo.config.admin, self.on_admin_change, self.poll_admin))
+        ]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        self.tasks = []
+
+    async def watch(self, target, callback, fallback):
+        """Follows the change stream of ``target``, resuming after transient errors"""
+        resume_token = None
+        while not self.bot.is_closed():
+            stream = target.watch(full_document='updateLookup', resume_after=resume_token)
+            try:
+                async for change in stream:
+                    resume_token = change['_id']
+                    callback(change)
+            except OperationFailure:
+                # Change streams need a replica set
+                await stream.close()
+                return await fallback()
+            except PyMongoError:
+                await stream.close()
+                await asyncio.sleep(5)
+
+    def on_guild_change(self, change):
+        config = self.bot.guild_config
+        if change['operationType'] in ('insert', 'update', 'replace'):
+            if change.get('fullDocument'):
+                config.refresh(change['fullDocument'])
+            else:
+                config.invalidate_document(change['documentKey']['_id'])
+        elif change['operationType'] == 'delete':
+            config.invalidate_document(change['documentKey']['_id'])
+        else:
+            # drop, rename, invalidate
+            config.cache.clear()
+
+    def on_tag_change(self, change):
+        tags = self.bot.player_tags
+        game = change.get('ns', {}).get('coll')
+        if change['operationType'] in ('insert', 'update', 'replace'):
+            if change.get('fullDocument'):
+                tags.refresh(game, change['fullDocument'])
+            else:
+                tags.invalidate_document(game, change['documentKey']['_id'])
+        elif change['operationType'] == 'delete':
+            tags.invalidate_document(game, change['documentKey']['_id'])
+        else:
+            tags.cache.clear()
+
+    def on_admin_change(self, change):
+        if change.get('documentKey', {}).get('_id', 'blacklist') != 'blacklist':
+            return
+        if change.get('fullDocument'):
+            self.bot.blacklist.load(change['fullDocument'])
+        else:
+            self.bot.loop.create_task(self.bot.blacklist.refresh())
+
+    async def poll_guilds(self):
+        config = self.bot.guild_config
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.poll_interval)
+            config.cache.expire()
+            keys = list(config.cache.keys())
+            found = set()
+            async for data in config.collection.find({'guild_id': {'$in': keys}}):
+                found.add(data['guild_id'])
+                config.refresh(data)
+            for key in keys:
+                if key not in found and key in config.cache:
+                    config.cache[key] = {}
+
+    async def poll_tags(self):
+        tags = self.bot.player_tags
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.poll_interval)
+            tags.cache.expire()
+            games = {}
+            for game, user_id in tags.cache.keys():
+                games.setdefault(game, []).append(user_id)
+
+            for game, user_ids in games.items():
+                found = set()
+                async for data in tags.database[game].find({'user_id': {'$in': user_ids}}):
+                    found.add(data['user_id'])
+                    tags.refresh(game, data)
+                for user_id in user_ids:
+                    if user_id not in found and (game, user_id) in tags.cache:
+                        tags.cache[game, user_id] = {}
+
+    async def poll_admin(self):
+        while not self.bot.is_closed():
+            await asyncio.sleep(self.poll_interval)
+            await self.bot.blacklist.refresh()
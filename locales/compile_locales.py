@@ -0,0 +1,9 @@
+"""Compiles locales/pot/*.po into the .mo catalogs i18n.py memory maps
+
+Run from the repository root: python -m locales.compile_locales
+"""
+
+from locales.i18n import compile_locales
+
+if __name__ == '__main__':
+    compile_locales()
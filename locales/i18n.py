@@ -1,15 +1,18 @@
+import contextvars
+import functools
+import mmap
 import re
 import os
+import struct
+from collections.abc import Mapping
 from pathlib import Path
 
 from discord.ext import commands
 from dotenv import find_dotenv, load_dotenv
 
-from ext.utils import get_stack_variable
-
 """Modified version of https://github.com/Cog-Creators/Red-DiscordBot/blob/V3/develop/redbot/core/i18n.py"""
 
-__all__ = ["reload_locales", "cog_i18n", "Translator"]
+__all__ = ["reload_locales", "compile_locales", "cog_i18n", "Translator", "current_language", "set_language"]
 
 load_dotenv(find_dotenv())
 
@@ -21,12 +24,91 @@ IN_MSGSTR = 4
 MSGID = 'msgid "'
 MSGSTR = 'msgstr "'
 
-_translators = []
+MO_MAGIC = 0x950412de
+
+NEWLINE_RE = re.compile("[\r\n]+")
+
+# language -> {normalized untranslated: translated}, shared by every Translator
+_catalog = {}
+
+# Language of the command being processed. asyncio tasks run in a copy
+# of the context they were created in, so every event handler sees the
+# language its own context set.
+current_language = contextvars.ContextVar('language', default='messages')
+
+
+def set_language(language):
+    """Binds ``language`` to the current context"""
+    current_language.set(language)
 
 
 def reload_locales():
-    for translator in _translators:
-        translator.load_translations()
+    _load_catalog()
+
+
+def _locales():
+    return [i for i in os.listdir('locales/pot') if i.endswith('.po')] + ['messages.pot']
+
+
+def _load_catalog():
+    """Loads every locale once into the shared catalog
+
+    Compiled ``.mo`` catalogs are memory mapped, locales that were not
+    compiled (or were edited since) are parsed from their ``.po`` file.
+    """
+    catalog = {}
+    for lang in _locales():
+        try:
+            translations = CompiledCatalog.open(lang)
+        except (OSError, ValueError):
+            translations = _read_po(lang)
+        catalog[lang.replace('.pot', '').replace('.po', '')] = translations
+
+    _catalog.clear()
+    _catalog.update(catalog)
+
+
+def _read_po(locale):
+    """Parses a ``.po`` file into {normalized untranslated: translated}"""
+    translations = {}
+    with get_locale_path(locale).open("r", encoding="utf-8") as translation_file:
+        for untranslated, translated in _parse(translation_file):
+            translated = _normalize(translated)
+            if translated:
+                translations[_normalize(untranslated, True)] = translated
+    return translations
+
+
+def compile_locales():
+    """Compiles every ``.po`` file into a ``.mo`` catalog next to it
+
+    Keys are stored already normalized and sorted so
+    :class:`CompiledCatalog` can binary search them in place.
+    """
+    for lang in _locales():
+        translations = sorted(
+            (k.encode('utf-8'), v.encode('utf-8')) for k, v in _read_po(lang).items()
+        )
+        keys_offset = 7 * 4
+        values_offset = keys_offset + len(translations) * 8
+        offset = values_offset + len(translations) * 8
+
+        # all keys are stored before all values
+        strings = [k for k, _ in translations] + [v for _, v in translations]
+        table = []
+        for string in strings:
+            table.append(struct.pack('<2I', len(string), offset))
+            offset += len(string) + 1
+
+        header = struct.pack('<7I', MO_MAGIC, 0, len(translations), keys_offset, values_offset, 0, 0)
+        path = get_compiled_path(lang)
+        # a running bot may have the catalog mapped, truncating it in place would crash it
+        tmp = path.with_suffix('.mo.tmp')
+        with tmp.open('wb') as f:
+            f.write(header)
+            f.write(b''.join(table))
+            f.write(b''.join(string + b'\0' for string in strings))
+        os.replace(tmp, path)
 
 
 def _parse(translation_file):
@@ -108,8 +190,7 @@ def _normalize(string, remove_newline=False):
         starts_with_space = s[0] in " \n\t\r"
         ends_with_space = s[-1] in " \n\t\r"
         if remove_newline:
-            newline_re = re.compile("[\r\n]+")
-            s = " ".join(filter(bool, newline_re.split(s)))
+            s = " ".join(filter(bool, NEWLINE_RE.split(s)))
         s = " ".join(filter(bool, s.split("\t")))
         s = " ".join(filter(bool, s.split(" ")))
         if starts_with_space:
@@ -131,6 +212,83 @@ def _normalize(string, remove_newline=False):
     return string
 
 
+@functools.lru_cache(maxsize=8192)
+def _normalize_source(string):
+    """Memoised normalization of the strings passed to a Translator"""
+    return _normalize(string, True)
+
+
+class CompiledCatalog(Mapping):
+    """Read-only mapping over a memory mapped ``.mo`` catalog
+
+    Only the entries that are looked up get decoded, once: lookups are
+    memoised, misses included, so the binary search only runs on the first
+    lookup of a string. The rest of the file stays on disk until the OS
+    pages it in.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        for order in '<>':
+            magic, _, self.size, self.keys_offset, self.values_offset = struct.unpack_from(order + '5I', self.data)
+            if magic == MO_MAGIC:
+                self.order = order
+                break
+        else:
+            raise ValueError(f'{path} is not a compiled catalog')
+        # key: translated, None if there is none
+        self.cache = {}
+
+    @classmethod
+    def open(cls, locale):
+        """Opens the compiled catalog of ``locale`` if it is up to date"""
+        path = get_compiled_path(locale)
+        if path.stat().st_mtime < get_locale_path(locale).stat().st_mtime:
+            raise ValueError(f'{path} is older than its source')
+        return cls(path)
+
+    def _string(self, table, index):
+        length, offset = struct.unpack_from(self.order + '2I', self.data, table + index * 8)
+        return self.data[offset:offset + length]
+
+    def __getitem__(self, key):
+        try:
+            value = self.cache[key]
+        except KeyError:
+            value = self.cache[key] = self._search(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def _search(self, key):
+        encoded = key.encode('utf-8')
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            found = self._string(self.keys_offset, mid)
+            if found < encoded:
+                lo = mid + 1
+            elif found > encoded:
+                hi = mid
+            else:
+                return self._string(self.values_offset, mid).decode('utf-8')
+        return None
+
+    def __iter__(self):
+        for index in range(self.size):
+            yield self._string(self.keys_offset, index).decode('utf-8')
+
+    def __len__(self):
+        return self.size
+
+
+def get_compiled_path(locale: str) -> Path:
+    """Path of the compiled catalog of a locale, it may not exist."""
+    return get_locale_path(locale).with_suffix('.mo')
+
+
 def get_locale_path(locale: str) -> Path:
     """
     Gets the folder path containing localization files.
@@ -163,63 +321,35 @@ class Translator:
         """
         self.cog_folder = Path(file_location).resolve().parent
         self.cog_name = name
-        self.translations = {}
 
-        _translators.append(self)
+        if not _catalog:
+            _load_catalog()
 
-        self.load_translations()
+    @property
+    def translations(self):
+        """The catalog shared by every translator"""
+        return _catalog
 
     def __call__(self, untranslated: str):
         """Translate the given string.
 
         This will look for the string in the translator's :code:`.pot` file,
-        with respect to the current locale.
+        with respect to the language bound to the current context.
         """
-        ctx = get_stack_variable('ctx')
-        normalized_untranslated = _normalize(untranslated, True)
+        return self.translate(untranslated, current_language.get())
+
+    def translate(self, untranslated: str, language: str):
+        """Translate the given string to an explicit language."""
         try:
-            return self.translations[ctx.language][normalized_untranslated]
+            return _catalog[language][_normalize_source(untranslated)]
         except KeyError:
             return untranslated
 
     def load_translations(self):
         """
-        Loads the current translations.
+        Reloads the shared catalog.
         """
-        self.translations = {}
-        translation_file = None
-        for lang in [i for i in os.listdir('locales/pot') if i.endswith('.po')] + ['messages.pot']:
-            locale_path = get_locale_path(lang)
-            try:
-
-                try:
-                    translation_file = locale_path.open("ru", encoding="utf-8")
-                except ValueError:  # We are using Windows
-                    translation_file = locale_path.open("r", encoding="utf-8")
-                self._parse(translation_file)
-            except (IOError, FileNotFoundError):  # The translation is unavailable
-                raise
-                pass
-            finally:
-                if translation_file is not None:
-                    translation_file.close()
-
-    def _parse(self, translation_file):
-        for translation in _parse(translation_file):
-            if os.name == 'nt':
-                file_char = '\\'
-            else:
-                file_char = '/'
-            self._add_translation(translation_file.name.split(file_char)[-1].replace('.pot', '').replace('.po', ''), *translation)
-
-    def _add_translation(self, lang, untranslated, translated):
-        untranslated = _normalize(untranslated, True)
-        translated = _normalize(translated)
-        if translated:
-            try:
-                self.translations[lang].update({untranslated: translated})
-            except KeyError:
-                self.translations[lang] = {untranslated: translated}
+        _load_catalog()
 
 
 def cog_i18n(translator: Translator):
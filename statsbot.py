@@ -20,8 +20,12 @@ from dotenv import find_dotenv, load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from ext import utils
+from ext.config import Blacklist, GuildConfig, PlayerTags
 from ext.context import CustomContext
+from ext.diskcache import DiskCache
+from ext.prefix import PrefixMatcher
 from ext.view import CustomView
+from ext.watcher import ConfigWatcher
 from ext.command import command
 from ext.utils import InvalidPlatform, InvalidBSTag, InvalidTag, NoTag, APIError
 from ext.log import LoggingHandler
@@ -55,9 +59,18 @@ class Statsy(commands.AutoShardedBot):
     ]
 
     def __init__(self):
+        self.default_routes = {}
         super().__init__(case_insensitive=True, command_prefix=None)
         self.session = aiohttp.ClientSession(loop=self.loop)
         self.mongo = AsyncIOMotorClient(os.getenv('mongo'))
+        self.guild_config = GuildConfig(self.mongo.config.guilds)
+        self.player_tags = PlayerTags(self.mongo.player_tags)
+        self.blacklist = Blacklist(self.mongo.config.admin)
+        self.config_watcher = ConfigWatcher(self)
+        if os.getenv('cache_dir'):
+            self.disk_cache = DiskCache(os.path.join(os.getenv('cache_dir'), 'responses.sqlite'))
+        else:
+            self.disk_cache = None
         self.uptime = datetime.datetime.utcnow()
         self.process = psutil.Process()
         self.remove_command('help')
@@ -65,6 +78,7 @@ class Statsy(commands.AutoShardedBot):
         self.maintenance_mode = False
         self.psa_message = None
         self.default_game = defaultdict(lambda: 'Clash_Royale')
+        self.prefix_matchers = {}
         try:
             self.dev_mode = platform.system() != 'Linux' and sys.argv[1] != '-d'
         except IndexError:
@@ -73,6 +87,7 @@ class Statsy(commands.AutoShardedBot):
         if not self.dev_mode:
             self.backup_task_loop = self.loop.create_task(self.backup_task())
             self.datadog_loop = self.loop.create_task(self.datadog())
+            self.config_watcher.start()
 
         self.load_extensions()
         self._add_commands()
@@ -107,9 +122,12 @@ class Statsy(commands.AutoShardedBot):
                 self.backup_task_loop.cancel()
                 self.clan_update.cancel()
                 self.datadog_loop.cancel()
+                self.config_watcher.stop()
                 self.event_notifications_loop.cancel()
             self.loop.run_until_complete(self.logout())
             self.loop.run_until_complete(self.session.close())
+            if self.disk_cache:
+                self.disk_cache.close()
             self.loop.close()
 
     def get_game_emojis(self):
@@ -149,16 +167,34 @@ class Statsy(commands.AutoShardedBot):
 
         id = getattr(message.guild, 'id', None)
 
-        cfg = await self.mongo.config.guilds.find_one({'guild_id': str(id)}) or {}
-
         prefixes = [
             f'<@{self.user.id}> ',
             f'<@!{self.user.id}> ',
-            cfg.get('prefix', '!')
+            await self.guild_config.prefix(id)
         ]
 
         return prefixes
 
+    def get_prefix_matcher(self, prefix):
+        """Returns the precompiled matcher of a guild prefix"""
+        try:
+            return self.prefix_matchers[prefix]
+        except KeyError:
+            if self.dev_mode:
+                prefixes = [prefix]
+            else:
+                prefixes = [f'<@{self.user.id}> ', f'<@!{self.user.id}> ', prefix]
+            matcher = self.prefix_matchers[prefix] = PrefixMatcher(prefixes)
+            return matcher
+
+    async def match_prefix(self, message):
+        """Returns the prefix a message was invoked with, None if it is not a command"""
+        if self.dev_mode:
+            prefix = './'
+        else:
+            prefix = await self.guild_config.prefix(getattr(message.guild, 'id', None))
+        return self.get_prefix_matcher(prefix).match(message.content)
+
     async def on_connect(self):
         """Called when the bot has established a
         gateway connection with discord
@@ -167,7 +203,7 @@ class Statsy(commands.AutoShardedBot):
         print('Statsy connected!')
         print('----------------------------')
         datadog.statsd.increment('statsy.connect')
-        self.blacklist = await self.mongo.config.admin.find_one({'_id': 'blacklist'})
+        await self.blacklist.refresh()
         async for g in self.mongo.config.guilds.find({'default_game': {'$exists': True}}):
             self.default_game[int(g['guild_id'])] = g['default_game']
         print('Guild syncing complete')
@@ -190,11 +226,18 @@ class Statsy(commands.AutoShardedBot):
               f'Users: {len(self.users)}\n' \
               '----------------------------'
         self.game_emojis = self.get_game_emojis()
+        utils.index_emojis(self.game_emojis)
         self.main_logger.info(fmt)
         print(fmt)
         if not self.dev_mode:
             await self.log_hook.send(f'```{fmt}```')
 
+    async def on_guild_emojis_update(self, guild, before, after):
+        """Keeps the emoji index in sync with the emoji servers"""
+        if guild.id in self.emoji_servers:
+            self.game_emojis = self.get_game_emojis()
+            utils.index_emojis(self.game_emojis)
+
     async def on_shard_connect(self, shard_id):
         """Called when a shard has successfuly
         connected to the gateway.
@@ -217,21 +260,17 @@ class Statsy(commands.AutoShardedBot):
     async def process_commands(self, message):
         """Utilises the CustomContext subclass of discord.Context"""
         await self.wait_until_ready()
-        ctx = await self.get_context(message)
+        if self.blacklist.is_blacklisted(message):
+            return
 
-        if ctx.prefix is None:
+        prefix = await self.match_prefix(message)
+        if prefix is None:
             return
 
-        try:
-            blacklist = [
-                str(ctx.author.id) in self.blacklist['users'],
-                str(ctx.channel.id) in self.blacklist['channels'],
-                str(getattr(ctx.guild, 'id', None)) in self.blacklist['guilds']
-            ]
-            if any(blacklist):
-                return
-        except AttributeError:
-            pass
+        ctx = await self.get_context(message, prefix=prefix)
+
+        if ctx.prefix is None:
+            return
 
         if ctx.command:
             if self.maintenance_mode is True:
@@ -239,24 +278,37 @@ class Statsy(commands.AutoShardedBot):
                     return await ctx.send('The bot is under maintenance at the moment!')
             else:
                 await self.invoke(ctx)
-        else:
-            if isinstance(ctx.channel, discord.TextChannel):
-                default_cog = self.get_cog(self.default_game[ctx.guild.id])
-            else:
-                default_cog = self.get_cog(self.default_game[ctx.channel.id])
-
-            ctx.message.content = ctx.prefix + default_cog.alias + ctx.message.content.replace(ctx.prefix, '', 1).strip()
-            ctx = await self.get_context(ctx.message)
-            if ctx.command:
-                if self.maintenance_mode is True:
-                    if message.author.id not in self.developers:
-                        return await ctx.send('The bot is under maintenance at the moment!')
-                else:
-                    await self.invoke(ctx)
-
-    async def get_context(self, message, *, cls=CustomContext):
+
+    def add_command(self, command):
+        super().add_command(command)
+        self.default_routes.clear()
+
+    def remove_command(self, name):
+        self.default_routes.clear()
+        return super().remove_command(name)
+
+    def get_default_routes(self, game):
+        """Returns the routing table of a default game, mapping
+        invokers without the game alias to the aliased command,
+        eg. profile -> crprofile
+        """
+        try:
+            return self.default_routes[game]
+        except KeyError:
+            cog = self.get_cog(game)
+            routes = {}
+            if cog is not None:
+                for name, cmd in self.all_commands.items():
+                    if cmd.instance is cog and name.startswith(cog.alias):
+                        routes[name[len(cog.alias):]] = cmd
+            self.default_routes[game] = routes
+            return routes
+
+    async def get_context(self, message, *, cls=CustomContext, prefix=None):
         """Overwrites the default StringView for space insensitivity
         Original: https://github.com/Rapptz/discord.py/blob/rewrite/discord/ext/commands/bot.py#L810-L879
+
+        ``prefix`` can be passed if it was already matched with match_prefix
         """
 
         view = CustomView(message.content)
@@ -265,42 +317,28 @@ class Statsy(commands.AutoShardedBot):
         if self._skip_check(message.author.id, self.user.id):
             return ctx
 
-        prefix = await self.get_prefix(message)
-        invoked_prefix = prefix
-
-        if isinstance(prefix, str):
-            if not view.skip_string(prefix):
-                return ctx
-        else:
-            try:
-                # if the context class' __init__ consumes something from the view this
-                # will be wrong.  That seems unreasonable though.
-                if message.content.startswith(tuple(prefix)):
-                    invoked_prefix = discord.utils.find(view.skip_string, prefix)
-                else:
-                    return ctx
-
-            except TypeError:
-                if not isinstance(prefix, list):
-                    raise TypeError("get_prefix must return either a string or a list of string, "
-                                    "not {}".format(prefix.__class__.__name__))
-
-                # It's possible a bad command_prefix got us here.
-                for value in prefix:
-                    if not isinstance(value, str):
-                        raise TypeError("Iterable command_prefix or list returned from get_prefix must "
-                                        "contain only strings, not {}".format(value.__class__.__name__))
-
-                # Getting here shouldn't happen
-                raise
+        invoked_prefix = prefix or await self.match_prefix(message)
+        if invoked_prefix is None:
+            return ctx
 
+        view.skip_string(invoked_prefix)
         invoker = view.get_word()
         ctx.invoked_with = invoker
         ctx.prefix = invoked_prefix
         ctx.command = self.all_commands.get(invoker)
 
+        if ctx.command is None:
+            # Fall back to the default game's version of the command
+            if isinstance(ctx.channel, discord.TextChannel):
+                game = self.default_game[ctx.guild.id]
+            else:
+                game = self.default_game[ctx.channel.id]
+            ctx.command = self.get_default_routes(game).get(invoker.lower())
+            if ctx.command is not None:
+                ctx.invoked_with = self.get_cog(game).alias + invoker
+
         if isinstance(ctx.channel, discord.TextChannel):
-            ctx.language = (await self.mongo.config.guilds.find_one({'guild_id': str(ctx.guild.id)}) or {}).get('language', 'messages')
+            ctx.language = await self.guild_config.language(ctx.guild.id)
         else:
             ctx.language = 'messages'
 
@@ -432,12 +470,11 @@ class Statsy(commands.AutoShardedBot):
                 ('statsy.channels', len([i.id for g in self.guilds for i in g.channels])),
                 ('statsy.memory', self.process.memory_full_info().uss / 1024**2),
                 ('statsy.tags_saved', sum([await self.mongo.player_tags[i].count_documents({}) for i in games])),
-                ('statsy.cache', len(self.get_cog('Clash_Royale').cache), ['game:clashroyale']),
-                ('statsy.cache', len(self.get_cog('Clash_Of_Clans').cache), ['game:clashofclans']),
-                ('statsy.cache', len(self.get_cog('Brawl_Stars').cache), ['game:brawlstars']),
                 ('statsy.claninfo', await self.mongo.config.guilds.count_documents({'claninfo': {'$exists': True}})),
                 ('statsy.tournament', await self.mongo.config.guilds.count_documents({'tournament': {'$exists': True}}))
             ]
+            for cog in ('Clash_Royale', 'Clash_Of_Clans', 'Brawl_Stars'):
+                metrics += self.get_cog(cog).api.metrics()
             for i in metrics:
                 try:
                     tags = i[2]